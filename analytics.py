@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import database
+
+# Per-process, date-indexed sales totals for the Advanced Analytics page.
+# The frames start from the daily rollup tables and are then kept current by
+# reading only sales with an id above the last one seen, so a rerun costs one
+# PRAGMA when nothing changed and a query over the new rows when something did.
+# New rows go to a small "recent" frame that is folded into the base frame
+# once it reaches RECENT_ROWS, so appending never copies the whole history.
+# Frames are replaced, never modified, so a caller can keep using the ones it
+# was handed while another thread refreshes.
+
+RECENT_ROWS = 50000
+
+_lock = threading.Lock()
+_state = None   # dict: db_path, version, last_id, and per table (base, recent)
+
+_PERIOD_FREQ = {"Monthly": "M", "Yearly": "Y"}
+
+
+# Day-indexed frame from (day, id, quantity, revenue) rows
+def _frame(rows, key):
+    days, ids, quantities, revenues = zip(*rows) if rows else ((), (), (), ())
+    df = pd.DataFrame(
+        {
+            key: np.array(ids, dtype=np.int64),
+            "quantity": np.array(quantities, dtype=np.int64),
+            "revenue": np.array(revenues, dtype=np.float64),
+        },
+        index=pd.DatetimeIndex(pd.to_datetime(list(days), format="%Y-%m-%d"), name="day"),
+    )
+    return df.sort_index(kind="stable")
+
+
+# Rollups and the last sale id, read in one snapshot so they agree
+def _load():
+    conn = database.connect_db()
+    c = conn.cursor()
+    c.execute("BEGIN")
+    try:
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM sales")
+        last_id = c.fetchone()[0]
+        c.execute("SELECT day, medicine_id, quantity, revenue FROM sales_daily_medicine")
+        medicines = _frame(c.fetchall(), "medicine_id")
+        c.execute("SELECT day, customer_id, quantity, revenue FROM sales_daily_customer")
+        customers = _frame(c.fetchall(), "customer_id")
+    finally:
+        conn.commit()
+    return {
+        "db_path": database.DB_PATH,
+        "last_id": last_id,
+        "medicines": (medicines, _frame([], "medicine_id")),
+        "customers": (customers, _frame([], "customer_id")),
+    }
+
+
+def _concat(frames):
+    combined = pd.concat(frames)
+    if not combined.index.is_monotonic_increasing:
+        combined = combined.sort_index(kind="stable")
+    return combined
+
+
+# Append sales with id > last_id as one row each. A (day, id) pair may then
+# appear more than once; every reader sums, so that needs no merging.
+def _append_new_sales(state):
+    c = database.connect_db().cursor()
+    c.execute(
+        """SELECT id, substr(date, 1, 10), medicine_id, customer_id, quantity, total
+           FROM sales WHERE id > ? ORDER BY id""",
+        (state["last_id"],)
+    )
+    rows = c.fetchall()
+    if not rows:
+        return state
+    state = dict(state, last_id=rows[-1][0])
+    for table, key, column in [("medicines", "medicine_id", 2), ("customers", "customer_id", 3)]:
+        base, recent = state[table]
+        recent = _concat([recent, _frame([(row[1], row[column], row[4], row[5]) for row in rows], key)])
+        if len(recent) >= RECENT_ROWS:
+            base, recent = _concat([base, recent]), recent.iloc[:0]
+        state[table] = (base, recent)
+    return state
+
+
+# Up-to-date state: "medicines" and "customers" each hold a (base, recent)
+# pair of day-indexed frames with an id column, quantity and revenue
+def sales_frames():
+    global _state
+    version = database.data_version()
+    with _lock:
+        state = _state
+        if state is None or state["db_path"] != database.DB_PATH:
+            state = _load()
+        elif state["version"] != version:
+            c = database.connect_db().cursor()
+            c.execute("SELECT COALESCE(MAX(id), 0) FROM sales")
+            if c.fetchone()[0] < state["last_id"]:
+                # Sales were removed; start again from the rollups
+                state = _load()
+            else:
+                state = _append_new_sales(state)
+        state["version"] = version
+        _state = state
+        return state
+
+
+# Rows of one table between two dates (inclusive)
+def _window(table, start_date, end_date):
+    base, recent = sales_frames()[table]
+    return pd.concat([base.loc[start_date:end_date], recent.loc[start_date:end_date]])
+
+
+# First and last day with any sales, or None when there are no sales yet
+def sales_date_range():
+    days = [frame.index for frame in sales_frames()["medicines"] if len(frame)]
+    if not days:
+        return None
+    first = min(index[0] for index in days)
+    last = max(index[-1] for index in days)
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+
+# Revenue per day, month or year between two dates (inclusive), as a Series
+def sales_over_time(start_date, end_date, period="Daily"):
+    revenue = _window("medicines", start_date, end_date)["revenue"]
+    if period == "Daily":
+        keys = revenue.index
+    else:
+        keys = revenue.index.to_period(_PERIOD_FREQ[period]).to_timestamp()
+    totals = revenue.groupby(keys).sum()
+    totals.name = "Total"
+    totals.index.name = None
+    return totals
+
+
+# Sum of `column` per name between two dates (inclusive), largest first.
+# Rows whose id is no longer in the catalog (deleted) are left out.
+def _top(table, key, names, column, label, start_date, end_date, limit):
+    window = _window(table, start_date, end_date)
+    per_id = window.groupby(key)[column].sum()
+    labels = pd.Index([names.get(i) for i in per_id.index.tolist()], dtype=object)
+    per_name = per_id.groupby(labels).sum()
+    top = per_name.nlargest(limit)
+    top.index.name = label
+    return top
+
+
+# Best-selling medicines by quantity between two dates (inclusive)
+def top_medicines(start_date, end_date, limit=5):
+    names = database.medicine_catalog().names
+    top = _top("medicines", "medicine_id", names, "quantity", "Medicine", start_date, end_date, limit)
+    top.name = "Qty"
+    return top
+
+
+# Biggest-spending customers by revenue between two dates (inclusive)
+def top_customers(start_date, end_date, limit=5):
+    names = database.customer_catalog().names
+    top = _top("customers", "customer_id", names, "revenue", "Customer", start_date, end_date, limit)
+    top.name = "Total"
+    return top
@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import database
+import validation
+
+# Headless HTTP/JSON API over database.py for POS terminals and bulk sync.
+# Plain asyncio, no web framework and no outside services: one event loop
+# parses requests, blocking SQLite reads run on a bounded thread pool, and
+# writes go to the group-commit writer, whose futures the loop awaits without
+# holding a pool thread. Set PHARMACY_API_TOKEN to require
+# "Authorization: Bearer <token>" on every request.
+
+API_TOKEN = os.environ.get('PHARMACY_API_TOKEN')
+WORKERS = 8             # threads running blocking database calls
+MAX_BODY = 8 << 20      # largest request body accepted, in bytes
+MAX_HEADERS = 100
+MAX_BATCH = 1000        # sales in one /sales/batch request
+PAGE_LIMIT = 1000       # rows in one listing response
+REPORT_CHUNK = 1000     # report rows read from the database at a time
+
+logger = logging.getLogger("pharmacy.api")
+
+MEDICINE_FIELDS = ["id", "name", "category", "buy_price", "sell_price", "stock", "expiry_date"]
+CUSTOMER_FIELDS = ["id", "name", "contact", "address"]
+CHANGE_FIELDS = ["seq", "id", "name", "category", "sell_price", "stock", "expiry_date"]
+
+_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+_executor = None
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Run a blocking database call on the worker pool
+async def _blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+# Await a write queued by one of database.py's *_async functions. Without
+# group commit those run the write on the calling thread, so that happens on
+# the pool instead of the event loop.
+async def _write(submit, *args):
+    if database.GROUP_COMMIT:
+        return await asyncio.wrap_future(submit(*args))
+    return await _blocking(lambda: submit(*args).result())
+
+
+# ─── REQUEST VALUES ────────────────────────────────────────────────────────────
+
+def _int(value, name, minimum=None, maximum=None):
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            raise HTTPError(400, f"{name} must be an integer")
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise HTTPError(400, f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise HTTPError(400, f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise HTTPError(400, f"{name} must be at most {maximum}")
+    return value
+
+
+def _str(data, name):
+    value = data.get(name)
+    if not isinstance(value, str):
+        raise HTTPError(400, f"{name} must be a string")
+    return value
+
+
+def _date(data, name):
+    value = _str(data, name)
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a YYYY-MM-DD date")
+    return value
+
+
+def _limit(query, default=100):
+    return _int(query.get("limit", default), "limit", 1, PAGE_LIMIT)
+
+
+# (customer_id, [(medicine_id, quantity), ...], prescription_id) from a sale object
+def _sale(data):
+    if not isinstance(data, dict):
+        raise HTTPError(400, "a sale must be an object")
+    lines = data.get("lines")
+    if not isinstance(lines, list) or not lines:
+        raise HTTPError(400, "lines must be a non-empty list")
+    parsed = []
+    for line in lines:
+        if not isinstance(line, dict):
+            raise HTTPError(400, "each line must be an object")
+        parsed.append((
+            _int(line.get("medicine_id"), "medicine_id"),
+            _int(line.get("quantity"), "quantity", minimum=1),
+        ))
+    prescription_id = data.get("prescription_id")
+    if prescription_id is not None:
+        prescription_id = _int(prescription_id, "prescription_id")
+    return _int(data.get("customer_id"), "customer_id"), parsed, prescription_id
+
+
+def _sale_result(outcome):
+    ok, messages = outcome
+    return {"ok": ok, "messages": messages}
+
+
+# ─── HANDLERS ──────────────────────────────────────────────────────────────────
+# Each takes (query parameters, JSON body) and returns (status, payload). A
+# payload that is an async iterator of bytes is streamed as chunked NDJSON.
+
+async def health(query, data):
+    return 200, {"ok": True}
+
+
+async def list_medicines(query, data):
+    after_id = _int(query["after_id"], "after_id") if "after_id" in query else None
+    rows = await _blocking(database.fetch_medicines_page, _limit(query), after_id)
+    return 200, {
+        "medicines": [dict(zip(MEDICINE_FIELDS, row)) for row in rows],
+        "next_after_id": rows[-1][0] if rows else None,
+    }
+
+
+async def search_medicines(query, data):
+    rows = await _blocking(database.search_medicines, query.get("q", ""), _limit(query, 20))
+    return 200, {"medicines": [dict(zip(["id", "name", "category", "sell_price", "stock"], row)) for row in rows]}
+
+
+async def list_customers(query, data):
+    after_id = _int(query["after_id"], "after_id") if "after_id" in query else None
+    rows = await _blocking(database.fetch_customers_page, _limit(query), after_id)
+    return 200, {
+        "customers": [dict(zip(CUSTOMER_FIELDS, row)) for row in rows],
+        "next_after_id": rows[-1][0] if rows else None,
+    }
+
+
+async def search_customers(query, data):
+    rows = await _blocking(database.search_customers, query.get("q", ""), _limit(query, 20))
+    return 200, {"customers": [dict(zip(["id", "name", "contact"], row)) for row in rows]}
+
+
+async def add_customer(query, data):
+    name, contact, address = _str(data, "name"), _str(data, "contact"), _str(data, "address")
+    error = validation.customer_error(name, contact, address)
+    if error:
+        raise HTTPError(400, error)
+    customer_id = await _write(database.add_customer_async, name.strip(), contact.strip(), address.strip())
+    return 201, {"id": customer_id}
+
+
+# Inventory delta feed: medicines changed after change number `since`.
+# Clients keep `next_since` and pass it back on their next poll.
+async def inventory_changes(query, data):
+    since = _int(query.get("since", 0), "since", minimum=0)
+    rows = await _blocking(database.fetch_inventory_changes, since, _limit(query, PAGE_LIMIT))
+    return 200, {
+        "changes": [dict(zip(CHANGE_FIELDS, row)) for row in rows if row[2] is not None],
+        "deleted": [row[1] for row in rows if row[2] is None],
+        "next_since": rows[-1][0] if rows else since,
+    }
+
+
+async def add_lot(query, data):
+    medicine_id = _int(data.get("medicine_id"), "medicine_id")
+    quantity = _int(data.get("quantity"), "quantity", minimum=1)
+    expiry_date = _date(data, "expiry_date")
+    lot_number = data.get("lot_number")
+    if lot_number is not None and not isinstance(lot_number, str):
+        raise HTTPError(400, "lot_number must be a string")
+    names = (await _blocking(database.medicine_catalog)).names
+    if medicine_id not in names:
+        raise HTTPError(404, "Medicine not found.")
+    await _write(database.add_lot_async, medicine_id, quantity, expiry_date, lot_number)
+    return 201, {"ok": True}
+
+
+async def record_sale(query, data):
+    customer_id, lines, prescription_id = _sale(data)
+    if customer_id not in (await _blocking(database.customer_catalog)).names:
+        raise HTTPError(404, "Customer not found.")
+    outcome = await _write(database.record_sales_batch_async, customer_id, lines, prescription_id)
+    return 200, _sale_result(outcome)
+
+
+# Many independent sales in one request. They are all queued before any is
+# awaited, so they share the writer's commits; each gets its own result and a
+# failing sale does not affect the others.
+async def record_sales(query, data):
+    sales = data.get("sales")
+    if not isinstance(sales, list) or not sales:
+        raise HTTPError(400, "sales must be a non-empty list")
+    if len(sales) > MAX_BATCH:
+        raise HTTPError(413, f"at most {MAX_BATCH} sales per request")
+
+    customers = (await _blocking(database.customer_catalog)).names
+    results = [None] * len(sales)
+    pending = []
+    for i, sale in enumerate(sales):
+        try:
+            customer_id, lines, prescription_id = _sale(sale)
+        except HTTPError as e:
+            results[i] = {"ok": False, "error": e.message}
+            continue
+        if customer_id not in customers:
+            results[i] = {"ok": False, "error": "Customer not found."}
+            continue
+        pending.append((i, _write(database.record_sales_batch_async, customer_id, lines, prescription_id)))
+
+    outcomes = await asyncio.gather(*(write for _, write in pending), return_exceptions=True)
+    for (i, _), outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("sale %d of a batch failed", i, exc_info=outcome)
+            results[i] = {"ok": False, "error": "internal error"}
+        else:
+            results[i] = _sale_result(outcome)
+    return 200, {"results": results}
+
+
+# Sales report between `start` and `end` (compared with sale timestamps, as
+# on the Generate Report page) as NDJSON, one row object per line. Rows are
+# read on a pool thread and handed over through a small queue, so memory
+# stays flat and a slow client slows the reader down instead of piling up rows.
+async def sales_report(query, data):
+    start, end = query.get("start"), query.get("end")
+    if not start or not end:
+        raise HTTPError(400, "start and end are required")
+    return 200, _stream_report(start, end)
+
+
+async def _stream_report(start, end):
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=2)
+    stopped = False
+
+    def produce():
+        report = database.iter_report(start, end, REPORT_CHUNK)
+        try:
+            for rows in report:
+                if stopped:
+                    break
+                asyncio.run_coroutine_threadsafe(chunks.put(rows), loop).result()
+        finally:
+            report.close()
+            asyncio.run_coroutine_threadsafe(chunks.put(None), loop).result()
+
+    producer = loop.run_in_executor(_executor, produce)
+    try:
+        while (rows := await chunks.get()) is not None:
+            yield "".join(
+                json.dumps(dict(zip(database.REPORT_COLUMNS, row))) + "\n" for row in rows
+            ).encode()
+    finally:
+        # Let a producer blocked on a full queue finish and notice the stop
+        stopped = True
+        while not producer.done():
+            while not chunks.empty():
+                chunks.get_nowait()
+            await asyncio.sleep(0.01)
+        await producer
+
+
+# path -> {method: handler}
+ROUTES = {
+    "/health": {"GET": health},
+    "/medicines": {"GET": list_medicines},
+    "/medicines/search": {"GET": search_medicines},
+    "/customers": {"GET": list_customers, "POST": add_customer},
+    "/customers/search": {"GET": search_customers},
+    "/inventory/changes": {"GET": inventory_changes},
+    "/lots": {"POST": add_lot},
+    "/sales": {"POST": record_sale},
+    "/sales/batch": {"POST": record_sales},
+    "/reports/sales": {"GET": sales_report},
+}
+
+
+# ─── HTTP ──────────────────────────────────────────────────────────────────────
+
+async def _dispatch(method, target, headers, body):
+    url = urlsplit(target)
+    methods = ROUTES.get(url.path)
+    if methods is None:
+        raise HTTPError(404, "no such endpoint")
+    handler = methods.get(method)
+    if handler is None:
+        raise HTTPError(405, f"use {', '.join(methods)}")
+    if API_TOKEN and headers.get("authorization") != f"Bearer {API_TOKEN}":
+        raise HTTPError(401, "missing or wrong API token")
+
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    data = {}
+    if body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "body must be a JSON object")
+    return await handler(query, data)
+
+
+async def _respond(writer, status, payload, keep_alive):
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    if hasattr(payload, "__aiter__"):
+        writer.write(f"{head}Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n".encode())
+        try:
+            async for chunk in payload:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+        finally:
+            # Stops the producer now if the client went away mid-stream
+            await payload.aclose()
+        writer.write(b"0\r\n\r\n")
+    else:
+        body = json.dumps(payload).encode()
+        writer.write(f"{head}Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+# Serve HTTP/1.1 requests on one connection until the client closes it
+async def _handle_connection(reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            # Until the body has been read, an error leaves the stream at an
+            # unknown position, so the connection is closed after responding
+            keep_alive = False
+            try:
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    raise HTTPError(400, "malformed request line")
+                headers = {}
+                while (line := await reader.readline()).strip():
+                    if len(headers) >= MAX_HEADERS:
+                        raise HTTPError(400, "too many headers")
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if "transfer-encoding" in headers:
+                    raise HTTPError(400, "chunked request bodies are not supported; send Content-Length")
+                length = _int(headers.get("content-length", "0"), "Content-Length", minimum=0)
+                if length > MAX_BODY:
+                    raise HTTPError(413, f"body larger than {MAX_BODY} bytes")
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload = await _dispatch(method, target, headers, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": e.message}
+            except Exception:
+                logger.exception("error handling %r", request_line)
+                status, payload = 500, {"error": "internal error"}
+            await _respond(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass    # client went away, or sent a line longer than the stream limit
+    except Exception:
+        logger.exception("error writing a response")
+    finally:
+        writer.close()
+
+
+# Run the API until cancelled. `listening`, if given, is called with the
+# bound port once connections are accepted (useful with port 0).
+async def serve(host="127.0.0.1", port=8080, workers=WORKERS, listening=None):
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-db")
+    server = await asyncio.start_server(_handle_connection, host, port)
+    logger.info("listening on %s", ", ".join(str(s.getsockname()) for s in server.sockets))
+    if listening:
+        listening(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        _executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the pharmacy HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="threads for blocking database calls")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    database.init_db()
+    database.start_alert_evaluator()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.stop_alert_evaluator()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Load generator for api.py. Each simulated terminal holds one keep-alive
+# connection and sends requests back to back for the chosen scenario; the
+# run reports requests per second and latency percentiles. It writes sales
+# and stock, so point it at a copy of the database.
+
+SCENARIOS = ["sales", "batch", "inventory", "search", "mixed"]
+SEARCH_TERMS = ["m", "med", "medicine 1", "medicine 12", "ant", "vit"]
+
+
+class Client:
+    def __init__(self, host, port, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(f"{head}\r\n".encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while size := int(await self.reader.readline(), 16):
+                chunks.append(await self.reader.readexactly(size + 2))
+            await self.reader.readline()
+            data = b"".join(chunk[:-2] for chunk in chunks)
+        else:
+            data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection") == "close":
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# One request of the scenario: (method, path, payload, sales it carries)
+def _next_request(scenario, rng, medicines, customers, batch, since):
+    if scenario == "mixed":
+        scenario = rng.choices(["sales", "inventory", "search"], weights=[6, 1, 3])[0]
+    if scenario == "search":
+        return "GET", f"/medicines/search?q={rng.choice(SEARCH_TERMS).replace(' ', '+')}", None, 0
+    if scenario == "inventory":
+        return "GET", f"/inventory/changes?since={since}&limit=200", None, 0
+
+    def sale():
+        return {
+            "customer_id": rng.choice(customers),
+            "lines": [{"medicine_id": rng.choice(medicines), "quantity": 1} for _ in range(rng.randint(1, 3))],
+        }
+    if scenario == "batch":
+        return "POST", "/sales/batch", {"sales": [sale() for _ in range(batch)]}, batch
+    return "POST", "/sales", sale(), 1
+
+
+async def _terminal(client, scenario, seed, deadline, medicines, customers, batch, since, latencies, counts):
+    rng = random.Random(seed)
+    try:
+        while time.perf_counter() < deadline:
+            method, path, payload, sales = _next_request(scenario, rng, medicines, customers, batch, since)
+            start = time.perf_counter()
+            try:
+                status, _ = await client.request(method, path, payload)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                client.close()
+                counts["errors"] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status == 200:
+                counts["sales"] += sales
+            else:
+                counts["errors"] += 1
+    finally:
+        client.close()
+
+
+# Pick medicines and customers to sell, and give the medicines plenty of stock
+async def _prepare(client, products):
+    _, data = await client.request("GET", f"/medicines?limit={products}")
+    medicines = [row["id"] for row in json.loads(data)["medicines"]]
+    _, data = await client.request("GET", "/customers?limit=1000")
+    customers = [row["id"] for row in json.loads(data)["customers"]]
+    if not medicines or not customers:
+        raise SystemExit("The database needs medicines and customers; see manage.py generate-data.")
+    for medicine_id in medicines:
+        await client.request("POST", "/lots", {"medicine_id": medicine_id, "quantity": 10 ** 6, "expiry_date": "2099-12-31"})
+    _, data = await client.request("GET", "/inventory/changes?since=0&limit=1")
+    since = json.loads(data)["next_since"]
+    return medicines, customers, since
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+async def run(url, scenario="mixed", connections=16, duration=10.0, batch=20, products=50, token=None, seed=1):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    setup = Client(host, port, token)
+    medicines, customers, since = await _prepare(setup, products)
+    setup.close()
+
+    latencies = []
+    counts = {"errors": 0, "sales": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _terminal(Client(host, port, token), scenario, seed + i, start + duration,
+                  medicines, customers, batch, since, latencies, counts)
+        for i in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "connections": connections,
+        "requests": len(latencies),
+        "errors": counts["errors"],
+        "requests_per_s": len(latencies) / elapsed,
+        "sales_per_s": counts["sales"] / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1e3 if latencies else None,
+        "p99_ms": _percentile(latencies, 0.99) * 1e3 if latencies else None,
+        "max_ms": latencies[-1] * 1e3 if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate load against the pharmacy HTTP API")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="base URL of a running api.py")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent terminals")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--batch", type=int, default=20, help="sales per /sales/batch request")
+    parser.add_argument("--products", type=int, default=50, help="medicines to restock and sell")
+    parser.add_argument("--token", help="API token, if the server requires one")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(
+        args.url, args.scenario, args.connections, args.duration, args.batch, args.products, args.token
+    ))
+    for name, value in result.items():
+        print(f"{name:16s} {value:10.2f}" if isinstance(value, float) else f"{name:16s} {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
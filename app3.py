@@ -1,21 +1,43 @@
 import streamlit as st
-import pandas as pd
+import io
 import os
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.svm import SVC
-from sklearn.pipeline import make_pipeline
+import reports
+import bulk_import
+import prescriptions
+from validation import medicine_error, customer_error
 from database import (
-    calculate_total_profit, calculate_total_sales,
-    fetch_medicines, fetch_customers, fetch_sales,
-    add_medicine, add_customer, medicines_expiring_this_week,
-    record_sale, generate_report,
+    init_db,
+    dashboard_summary,
+    medicine_catalog, customer_catalog, search_medicines, search_customers,
+    fetch_medicines_page, fetch_customers_page, fetch_recent_sales,
+    add_medicine, add_customer,
+    record_sales_batch, record_sales_with_prescription, fetch_prescription_images, iter_report, REPORT_COLUMNS,
     delete_medicine, delete_customer,
-    update_medicine, update_customer
+    update_medicine, update_customer, add_lot, fetch_lots, sellable_stock,
+    fetch_alerts, fetch_alert_thresholds, set_alert_threshold, delete_alert_threshold,
+    start_alert_evaluator, DEFAULT_LOW_STOCK, DEFAULT_EXPIRY_DAYS,
+    query_instrumentation, set_query_instrumentation, begin_query_capture, end_query_capture,
+    page_query_stats, reset_query_stats, slow_queries
 )
 
-# Ensure static folder exists
+# Ensure static folder exists, without report exports from older versions
 os.makedirs("static", exist_ok=True)
+reports.remove_legacy_exports()
+
+# Create or upgrade the schema once per process
+init_db()
+
+# Keep the precomputed alerts current in the background (one thread per process)
+start_alert_evaluator()
+
+# Rows of a sales report rendered on the page; the download has all of them
+REPORT_PREVIEW_ROWS = 200
+
+# Rows of the reorder plan rendered on the page; the download has all of them
+PLANNER_PREVIEW_ROWS = 200
+
+# Matches offered by a search picker
+SEARCH_RESULTS = 20
 
 st.markdown("""
     <style>
@@ -72,16 +94,72 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def update_prescription_paths():
-    sales = fetch_sales()
-    for sale in sales:
-        _, _, _, _, _, pres_path = sale
-        if pres_path and "prescriptions" in pres_path:
-            new_path = pres_path.replace("prescriptions", "static")
-            if os.path.exists(pres_path) and not os.path.exists(new_path):
-                os.rename(pres_path, new_path)
-            # Update database (you’ll need to implement this in database.py)
-            # Example: update_sale_prescription_path(sale_id, new_path)
+# Link to a file stored under static/, served by Streamlit's static file server
+def static_link(path, label="View"):
+    if pd.isna(path) or not path:
+        return "N/A"
+    return f'<a href="app/{path.replace(os.sep, "/")}" target="_blank">{label}</a>'
+
+
+# Prescription cells for a column of stored paths: the thumbnail, opening the
+# processed copy, with the original a separate link so it only loads on
+# demand. Files not processed yet fall back to a plain link.
+def prescription_cells(paths):
+    images = fetch_prescription_images(paths.dropna().tolist())
+
+    def cell(path):
+        if pd.isna(path) or path not in images:
+            return static_link(path)
+        view_path, thumbnail_path = images[path]
+        thumbnail = f'<img src="app/{thumbnail_path.replace(os.sep, "/")}" alt="Prescription">'
+        return f'{static_link(view_path, thumbnail)}<br>{static_link(path, "Original")}'
+
+    return paths.apply(cell)
+
+
+# Upload preview, cached so reruns of the page don't decode the photo again
+@st.cache_data(max_entries=16, show_spinner=False)
+def upload_thumbnail(data):
+    return prescriptions.thumbnail_bytes(io.BytesIO(data))
+
+
+# Render Previous/Next controls for a keyset-paginated listing and return the
+# rows of the current page. `forward`/`backward` name the fetch_page keyword
+# that steps to the next/previous page from the id at that edge of the page.
+def keyset_pager(key, fetch_page, page_size, forward="after_id", backward="before_id"):
+    cursor = st.session_state.get(key, {})
+    rows = fetch_page(page_size + 1, **cursor)
+    if not rows and cursor:
+        st.session_state[key] = cursor = {}
+        rows = fetch_page(page_size + 1)
+
+    # One extra row tells us whether there is anything beyond this page
+    going_back = backward in cursor
+    has_more = len(rows) > page_size
+    if going_back:
+        rows = rows[-page_size:]
+        has_prev, has_next = has_more, True
+    else:
+        rows = rows[:page_size]
+        has_prev, has_next = bool(cursor), has_more
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("◀ Previous", key=f"{key}_prev", disabled=not has_prev):
+        st.session_state[key] = {backward: rows[0][0]}
+        st.rerun()
+    if next_col.button("Next ▶", key=f"{key}_next", disabled=not has_next):
+        st.session_state[key] = {forward: rows[-1][0]}
+        st.rerun()
+    return rows
+
+
+# Server-side typeahead: a search box whose top matches from `search` fill a
+# selectbox, so only SEARCH_RESULTS options reach the browser. Returns the
+# selected id, or None when nothing matches.
+def search_picker(label, search, key):
+    query = st.text_input(f"Search {label}", key=f"{key}_search", placeholder="Type part of a name, category or contact")
+    labels = {row[0]: f"{row[1]} · {row[2]} (#{row[0]})" for row in search(query, SEARCH_RESULTS)}
+    return st.selectbox(label, list(labels), format_func=labels.get, key=key)
 
 
 # ─── LOGIN LOGIC ───────────────────────────────────────────────────────────────
@@ -123,6 +201,11 @@ with st.sidebar:
         st.session_state.logged_in = False
         st.rerun()
 
+# pandas is only needed past the login screen, so it is not paid for there
+import pandas as pd
+import analytics
+import forecasting
+
 
 
 # ─── CSS & TITLE ────────────────────────────────────────────────────────────────
@@ -168,50 +251,54 @@ st.markdown("""
 
 st.markdown('<h2 class="stTitle">Pharmacy Management System 🏥</h2>', unsafe_allow_html=True)
 
-# Update old paths on app start (run once)
-if 'paths_updated' not in st.session_state:
-    update_prescription_paths()
-    st.session_state.paths_updated = True
-
 # ─── SIDEBAR NAVIGATION ────────────────────────────────────────────────────────
 st.sidebar.markdown('<div class="stSidebar">', unsafe_allow_html=True)
 st.sidebar.title("Navigation")
-menu = ["Dashboard", "Manage Medicines", "Manage Customers", "Record Sale", "Generate Report", "Advanced Analytics", "Medicine Recommender", "Alerts"]
+menu = ["Dashboard", "Manage Medicines", "Manage Customers", "Bulk Import", "Record Sale", "Generate Report", "Advanced Analytics", "Medicine Recommender", "Alerts", "Reorder Planner"]
 
 
 
 choice = st.sidebar.radio("Select an option", menu)
 st.sidebar.markdown('</div>', unsafe_allow_html=True)
 
+# ─── QUERY PROFILER ────────────────────────────────────────────────────────────
+# Admin-only: records every query this rerun makes; filled in after the page runs
+with st.sidebar.expander("Query Profiler"):
+    profiling, slow_ms, explain = query_instrumentation()
+    profiling = st.checkbox("Record queries", value=profiling)
+    slow_ms = st.number_input("Slow query threshold (ms)", min_value=0.0, value=float(slow_ms), step=10.0)
+    explain = st.checkbox("Capture EXPLAIN QUERY PLAN for slow queries", value=explain)
+    set_query_instrumentation(profiling, slow_ms, explain)
+    profiler_panel = st.container()
+begin_query_capture()
+
 # ─── PAGES ─────────────────────────────────────────────────────────────────────
 
 # Dashboard
 if choice == "Dashboard":
     st.markdown('<h3 class="stHeader">Dashboard Overview 📊</h3>', unsafe_allow_html=True)
+    summary = dashboard_summary()
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Total Medicines", len(fetch_medicines()))
-    col2.metric("Total Customers", len(fetch_customers()))
-    col3.metric("Total Transactions", len(fetch_sales()))
-    total_presc = sum(1 for *_, pres in fetch_sales() if pres)
-    col4.metric("Prescriptions Uploaded", total_presc)
+    col1.metric("Total Medicines", summary["medicines"])
+    col2.metric("Total Customers", summary["customers"])
+    col3.metric("Total Transactions", summary["transactions"])
+    col4.metric("Prescriptions Uploaded", summary["prescriptions"])
 
     s1, s2, s3 = st.columns(3)
-    s1.metric("Total Sales Amount", f"₹{calculate_total_sales():.2f}")
-    s2.metric("Total Profit", f"₹{calculate_total_profit():.2f}")
-    s3.metric("Expires This Week", medicines_expiring_this_week())
+    s1.metric("Total Sales Amount", f"₹{summary['total_sales']:.2f}")
+    s2.metric("Total Profit", f"₹{summary['total_profit']:.2f}")
+    s3.metric("Expiring Soon", summary["expiring_soon"])
 
     st.subheader("Recent Sales Transactions")
-    sales_data = fetch_sales()
+    sales_data = keyset_pager("recent_sales", fetch_recent_sales, 5, forward="before_id", backward="after_id")
     if sales_data:
         df = pd.DataFrame(
             sales_data,
-            columns=["Customer", "Medicine", "Qty", "Total", "Date", "Prescription"]
+            columns=["ID", "Customer", "Medicine", "Qty", "Total", "Date", "Prescription"]
         )
-        df["Prescription Link"] = df["Prescription"].apply(
-            lambda x: f'<a href="app/static/{os.path.basename(x)}" target="_blank">View</a>' if pd.notna(x) else "N/A"
-        )
-        display_df = df.drop(columns=["Prescription"])
-        html = display_df.tail(5).to_html(escape=False, index=False)
+        df["Prescription Link"] = prescription_cells(df["Prescription"])
+        display_df = df.drop(columns=["ID", "Prescription"])
+        html = display_df.to_html(escape=False, index=False)
         st.markdown(html, unsafe_allow_html=True)        
     else:
         st.write("No sales yet.")
@@ -219,7 +306,7 @@ if choice == "Dashboard":
 # Manage Medicines
 elif choice == "Manage Medicines":
     st.markdown('<h3 class="stHeader">Manage Medicines 💊</h3>', unsafe_allow_html=True)
-    action = st.selectbox("Select Action", ["Add Medicine", "Update Medicine", "Delete Medicine"])
+    action = st.selectbox("Select Action", ["Add Medicine", "Receive Stock", "Update Medicine", "Delete Medicine"])
     if action == "Add Medicine":
         name = st.text_input("Medicine Name")
         category = st.text_input("Category")
@@ -228,41 +315,48 @@ elif choice == "Manage Medicines":
         stock = st.number_input("Stock", min_value=0, step=1)
         expiry_date = st.date_input("Expiry Date")
         if st.button("Add Medicine"):
-            if not name.strip():
-                st.error("Medicine Name cannot be empty.")
-            elif not category.strip():
-                st.error("Category cannot be empty.")
-            elif buy_price <= 0:
-                st.error("Buy Price must be greater than 0.")
-            elif sell_price <= 0:
-                st.error("Sell Price must be greater than 0.")
-            elif stock < 0:
-                st.error("Stock cannot be negative.")
+            error = medicine_error(name, category, buy_price, sell_price, stock)
+            if error:
+                st.error(error)
             else:
                 add_medicine(name, category, buy_price, sell_price, stock, expiry_date.strftime("%Y-%m-%d"))
                 st.success(f"Medicine '{name}' added successfully!")
+    elif action == "Receive Stock":
+        meds = medicine_catalog()
+        med_id = search_picker("Medicine", search_medicines, "receive_medicine")
+        lot_number = st.text_input("Lot Number")
+        lot_qty = st.number_input("Quantity Received", min_value=0, step=1)
+        lot_expiry = st.date_input("Lot Expiry Date")
+        if st.button("Receive Stock"):
+            if med_id is None:
+                st.error("Add the medicine first.")
+            elif lot_qty <= 0:
+                st.error("Quantity Received must be greater than 0.")
+            else:
+                add_lot(med_id, lot_qty, lot_expiry.strftime("%Y-%m-%d"), lot_number.strip() or None)
+                st.success(f"Received {lot_qty} x {meds.names[med_id]}.")
+        if med_id is not None:
+            st.caption("Lots on hand (sold earliest expiry first)")
+            st.dataframe(
+                pd.DataFrame(fetch_lots(med_id), columns=["Lot ID", "Lot Number", "Quantity", "Expiry_date", "Received"]),
+                height=150
+            )
     elif action == "Update Medicine":
-        medicines = fetch_medicines()
-        med_map = {med[1]: med[0] for med in medicines}
-        sel = st.selectbox("Select Medicine to Update", list(med_map.keys()))
-        med_id = med_map[sel]
+        meds = medicine_catalog()
+        med_id = search_picker("Medicine to Update", search_medicines, "update_medicine")
+        sel = meds.names.get(med_id, "")
         new_name = st.text_input("New Name", value=sel)
         new_category = st.text_input("New Category")
         new_buy = st.number_input("New Buy Price", min_value=0.0, step=0.1)
         new_sell = st.number_input("New Sell Price", min_value=0.0, step=0.1)
-        new_stock = st.number_input("New Stock", min_value=0, step=1)
+        new_stock = st.number_input("New Stock (replaces all lots)", min_value=0, step=1)
         new_expiry = st.date_input("New Expiry Date")
         if st.button("Update Medicine"):
-            if not new_name.strip():
-                st.error("New Name cannot be empty.")
-            elif not new_category.strip():
-                st.error("New Category cannot be empty.")
-            elif new_buy <= 0:
-                st.error("New Buy Price must be > 0.")
-            elif new_sell <= 0:
-                st.error("New Sell Price must be > 0.")
-            elif new_stock < 0:
-                st.error("New Stock cannot be negative.")
+            error = medicine_error(new_name, new_category, new_buy, new_sell, new_stock)
+            if med_id is None:
+                st.error("Select a medicine to update.")
+            elif error:
+                st.error(error)
             else:
                 update_medicine(
                     med_id, new_name, new_category,
@@ -271,15 +365,14 @@ elif choice == "Manage Medicines":
                 )
                 st.success(f"Medicine '{sel}' updated!")
     else:  # Delete Medicine
-        medicines = fetch_medicines()
-        med_map = {med[1]: med[0] for med in medicines}
-        sel = st.selectbox("Select Medicine to Delete", list(med_map.keys()))
-        if st.button("Delete Medicine"):
-            delete_medicine(med_map[sel])
-            st.success(f"Medicine '{sel}' deleted!")
+        meds = medicine_catalog()
+        med_id = search_picker("Medicine to Delete", search_medicines, "delete_medicine")
+        if st.button("Delete Medicine") and med_id is not None:
+            delete_medicine(med_id)
+            st.success(f"Medicine '{meds.names[med_id]}' deleted!")
     st.subheader("Current Inventory")
     inv = pd.DataFrame(
-        fetch_medicines(),
+        keyset_pager("inventory_page", fetch_medicines_page, 50),
         columns=["ID", "Name", "Category", "Buy_price", "Sell_price", "Stock", "Expiry_date"]
     )
     st.dataframe(inv, height=200)
@@ -293,60 +386,70 @@ elif choice == "Manage Customers":
         contact = st.text_input("Customer Contact")
         address = st.text_area("Customer Address")
         if st.button("Add Customer"):
-            if not name.strip():
-                st.error("Customer Name cannot be empty.")
-            elif not contact.strip() or not contact.isdigit() or len(contact) < 10:
-                st.error("Contact must be a valid phone number (at least 10 digits).")
-            elif not address.strip():
-                st.error("Address cannot be empty.")
+            error = customer_error(name, contact, address)
+            if error:
+                st.error(error)
             else:
                 add_customer(name, contact, address)
                 st.success(f"Customer '{name}' added!")
     elif action == "Update Customer":
-        customers = fetch_customers()
-        cust_map = {c[1]: c[0] for c in customers}
-        sel = st.selectbox("Select Customer to Update", list(cust_map.keys()))
-        cust_id = cust_map[sel]
+        custs = customer_catalog()
+        cust_id = search_picker("Customer to Update", search_customers, "update_customer")
+        sel = custs.names.get(cust_id, "")
         new_name = st.text_input("New Name", value=sel)
         new_contact = st.text_input("New Contact")
         new_address = st.text_area("New Address")
         if st.button("Update Customer"):
-            if not new_name.strip():
-                st.error("New Name cannot be empty.")
-            elif not new_contact.strip() or not new_contact.isdigit() or len(new_contact) < 10:
-                st.error("New Contact must be a valid phone number.")
-            elif not new_address.strip():
-                st.error("New Address cannot be empty.")
+            error = customer_error(new_name, new_contact, new_address)
+            if cust_id is None:
+                st.error("Select a customer to update.")
+            elif error:
+                st.error(error)
             else:
                 update_customer(cust_id, new_name, new_contact, new_address)
                 st.success(f"Customer '{sel}' updated!")
     else:  # Delete Customer
-        customers = fetch_customers()
-        cust_map = {c[1]: c[0] for c in customers}
-        sel = st.selectbox("Select Customer to Delete", list(cust_map.keys()))
-        if st.button("Delete Customer"):
-            delete_customer(cust_map[sel])
-            st.success(f"Customer '{sel}' deleted!")
+        custs = customer_catalog()
+        cust_id = search_picker("Customer to Delete", search_customers, "delete_customer")
+        if st.button("Delete Customer") and cust_id is not None:
+            delete_customer(cust_id)
+            st.success(f"Customer '{custs.names[cust_id]}' deleted!")
     st.subheader("Customer List")
-    cust_df = pd.DataFrame(fetch_customers(), columns=["ID", "Name", "Contact", "Address"])
+    cust_df = pd.DataFrame(keyset_pager("customers_page", fetch_customers_page, 50), columns=["ID", "Name", "Contact", "Address"])
     st.dataframe(cust_df, height=200)
 
+elif choice == "Bulk Import":
+    st.markdown('<h3 class="stHeader">Bulk Import 📥</h3>', unsafe_allow_html=True)
+    kind = st.selectbox("Import", ["Medicines", "Customers"])
+    columns = bulk_import.MEDICINE_COLUMNS if kind == "Medicines" else bulk_import.CUSTOMER_COLUMNS
+    st.caption("CSV header: " + ", ".join(columns) + (" (expiry_date as YYYY-MM-DD)" if kind == "Medicines" else ""))
+    upload = st.file_uploader("Upload CSV", type=["csv"])
+    if st.button("Import") and upload:
+        upload.seek(0)
+        text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        try:
+            inserted, errors = bulk_import.IMPORTERS[kind.lower()](text)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success(f"Imported {inserted} {kind.lower()}.")
+            if errors:
+                st.error(f"{len(errors)} row(s) skipped.")
+                st.dataframe(pd.DataFrame(errors, columns=["Line", "Error"]), height=200)
+        finally:
+            text.detach()
+
 elif choice == "Record Sale":
     st.markdown('<h3 class="stHeader">Record a New Sale 🛒</h3>', unsafe_allow_html=True)
 
-    customers = fetch_customers()
-    medicines = fetch_medicines()
+    custs = customer_catalog()
+    meds = medicine_catalog()
 
-    if not customers or not medicines:
+    if not custs.names or not meds.names:
         st.error("No customers or medicines available.")
     else:
-        # Create a mapping from customer name to ID
-        customer_name_to_id = {c[1]: c[0] for c in customers}
-        customer_names = list(customer_name_to_id.keys())
-
-        # ✅ ONE autocomplete text box using selectbox
-        selected_customer_name = st.selectbox("Select Customer", customer_names)
-        customer_id = customer_name_to_id[selected_customer_name]
+        # ✅ ONE autocomplete text box: matches are looked up on the server
+        customer_id = search_picker("Customer", search_customers, "sale_customer")
 
 
 
@@ -355,28 +458,35 @@ elif choice == "Record Sale":
             st.session_state.cart = []
 
         st.subheader("Add Medicines to Cart")
-        med_names = [m[1] for m in medicines]
-        med_id_map = {m[1]: m[0] for m in medicines}
-        med_stock_map = {m[0]: m[5] for m in medicines}
-        med_price_map = {m[0]: m[4] for m in medicines}
-
+        # The search box sits outside the form so typing updates the matches
+        med_id = search_picker("Medicine", search_medicines, "med_select")
         with st.form("med_form", clear_on_submit=True):
-            med_name = st.selectbox("Select Medicine", med_names, key="med_select")
             quantity = st.number_input("Quantity", min_value=1, step=1, key="qty_select")
             add_med = st.form_submit_button("Add to Cart")
 
             if add_med:
-                med_id = med_id_map[med_name]
-                if quantity > med_stock_map[med_id]:
-                    st.error("Not enough stock available.")
+                med_name = meds.names.get(med_id)
+                if med_name is None:
+                    st.error("Select a medicine first.")
                 else:
-                    st.session_state.cart.append((med_id, med_name, quantity, med_price_map[med_id]))
-                    st.success(f"Added {quantity} x {med_name} to cart")
+                    # Checked against unexpired lots, as the sale will be;
+                    # expired units are still counted in stock
+                    sellable = sellable_stock(med_id)
+                    wanted = quantity + sum(q for m, _, q, _ in st.session_state.cart if m == med_id)
+                    expired = meds.stock[med_id] - sellable
+                    if wanted > sellable:
+                        st.error("Not enough stock available." + (f" {expired} units have expired." if expired else ""))
+                    else:
+                        st.session_state.cart.append((med_id, med_name, quantity, meds.prices[med_id]))
+                        st.success(f"Added {quantity} x {med_name} to cart")
 
         # Prescription uploader
         prescription = st.file_uploader("Upload Prescription (jpg/jpeg/png)", type=["jpg", "jpeg", "png"])
         if prescription:
-            st.image(prescription, caption="Preview Prescription", width=200)
+            try:
+                st.image(upload_thumbnail(prescription.getvalue()), caption="Preview Prescription")
+            except OSError:
+                st.warning("This file could not be read as an image.")
 
         # Display Cart Summary
         if st.session_state.cart:
@@ -388,18 +498,21 @@ elif choice == "Record Sale":
             st.write(f"### Total Amount: ₹{total}")
 
         # Final Sale Submission
-        if st.button("Record Sale") and st.session_state.cart:
-            path = None
+        if st.button("Record Sale", disabled=customer_id is None) and st.session_state.cart:
+            lines = [(med_id, qty) for med_id, _, qty, _ in st.session_state.cart]
             if prescription:
-                path = os.path.join("static", prescription.name)
-                with open(path, "wb") as f:
-                    f.write(prescription.read())
-
-            for med_id, _, qty, _ in st.session_state.cart:
-                msg = record_sale(customer_id, med_id, qty, path)
-                st.success(msg)
+                prescription.seek(0)
+                ok, results = record_sales_with_prescription(customer_id, lines, prescription, prescription.name)
+            else:
+                ok, results = record_sales_batch(customer_id, lines)
+            for (_, med_name, qty, _), msg in zip(st.session_state.cart, results):
+                if ok:
+                    st.success(f"{med_name} x {qty}: {msg}")
+                else:
+                    st.error(f"{med_name} x {qty}: {msg}")
 
-            st.session_state.cart = []  # Clear cart after submission
+            if ok:
+                st.session_state.cart = []  # Clear cart after submission
 
 
 
@@ -410,23 +523,44 @@ elif choice == "Generate Report":
     st.markdown('<h3 class="stHeader">Generate Sales Report 📊</h3>', unsafe_allow_html=True)
     sd = st.date_input("Start Date")
     ed = st.date_input("End Date")
+    formats = [f for f in reports.FORMATS if f != "Parquet" or reports.parquet_available()]
+    export_format = st.selectbox("Download Format", formats)
     if st.button("Generate Report"):
         if sd > ed:
             st.error("Start Date must be before End Date.")
         else:
-            rpt = generate_report(sd.strftime('%Y-%m-%d'), ed.strftime('%Y-%m-%d'))
+            start_key, end_key = sd.strftime('%Y-%m-%d'), ed.strftime('%Y-%m-%d')
 
-            if rpt is not None and not rpt.empty:
-                rpt["Prescription Link"] = rpt["prescription"].apply(
-                    lambda x: f'<a href="app/static/{os.path.basename(x)}" target="_blank">View</a>' if pd.notna(x) else "N/A"
-                )
+            # Only the first rows are rendered on the page; the full range is
+            # streamed to a file so large reports never sit in memory
+            preview = next(iter_report(start_key, end_key, REPORT_PREVIEW_ROWS), [])
+
+            if preview:
+                rpt = pd.DataFrame(preview, columns=REPORT_COLUMNS)
+                rpt["Prescription Link"] = prescription_cells(rpt["prescription"])
                 display_rpt = rpt.drop(columns=["prescription"])
                 html = display_rpt.to_html(escape=False, index=False)
+                if len(preview) == REPORT_PREVIEW_ROWS:
+                    st.caption(f"Showing the first {REPORT_PREVIEW_ROWS} rows. Download the report for all of them.")
                 st.markdown(html, unsafe_allow_html=True)
 
-                # Allow download as CSV
-                csv = rpt.to_csv(index=False)
-                st.download_button("Download CSV", csv, file_name="sales_report.csv", mime="text/csv")
+                # Allow download of the whole range. The export is streamed to
+                # a private file; only files under the download limit are read
+                # back into memory to be served.
+                path = reports.export_report(start_key, end_key, export_format)
+                if reports.downloadable(path):
+                    st.download_button(
+                        f"⬇️ Download {export_format}",
+                        data=lambda: reports.read_export(path),
+                        file_name=os.path.basename(path),
+                        on_click="ignore",
+                    )
+                else:
+                    st.warning(
+                        f"This report is {os.path.getsize(path) / 2 ** 20:.1f} MB, over the "
+                        f"{reports.DOWNLOAD_MAX_BYTES / 2 ** 20:.1f} MB download limit. It was saved on the "
+                        f"server as {os.path.abspath(path)} for the next hour; choose a shorter range to download it here."
+                    )
 
             else:
                 st.write("No records in this range.")
@@ -434,51 +568,30 @@ elif choice == "Generate Report":
 
 elif choice == "Advanced Analytics":
     st.markdown('<h3 class="stHeader">Advanced Analytics 📈</h3>', unsafe_allow_html=True)
-    sales = fetch_sales()
+    bounds = analytics.sales_date_range()
 
-    if sales:
+    if bounds:
         try:
-            df = pd.DataFrame(
-                sales,
-                columns=["Customer", "Medicine", "Qty", "Total", "Date", "prescription"]
-            )
-
-            # Convert Date to datetime
-            df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
-            if df["Date"].isna().any():
-                st.warning("Some dates could not be parsed and will be excluded.")
-            df = df.dropna(subset=["Date"])
-
-            # Sort and set Date index, ensuring uniqueness
-            df = df.sort_values("Date")
-            df.set_index("Date", inplace=True)
-            df = df.loc[~df.index.duplicated(keep='first')]  # Remove duplicate dates
-
-            # Ensure numeric columns
-            df["Qty"] = pd.to_numeric(df["Qty"], errors='coerce').fillna(0)
-            df["Total"] = pd.to_numeric(df["Total"], errors='coerce').fillna(0)
-
             # Date range filter
             st.subheader("Filter by Date Range")
-            min_date = df.index.min().date()
-            max_date = df.index.max().date()
+            min_date = pd.to_datetime(bounds[0]).date()
+            max_date = pd.to_datetime(bounds[1]).date()
             start_date, end_date = st.date_input(
                 "Select Date Range",
                 [min_date, max_date],
                 min_value=min_date,
                 max_value=max_date
             )
-            filtered_df = df.loc[start_date:end_date]
+            start_key = start_date.strftime('%Y-%m-%d')
+            end_key = end_date.strftime('%Y-%m-%d')
 
             # Time period filter
             st.subheader("Select Time Period for Analysis")
             time_period = st.selectbox("Time Period", ["Daily", "Monthly", "Yearly"])
-            resample_freq = {"Daily": "D", "Monthly": "M", "Yearly": "Y"}
-            freq = resample_freq[time_period]
 
             # Sales Over Time
             st.subheader(f"Sales Over Time ({time_period})")
-            sales_data = filtered_df["Total"].resample(freq).sum()
+            sales_data = analytics.sales_over_time(start_key, end_key, time_period)
             if sales_data.empty:
                 st.warning("No sales data for the selected period.")
             else:
@@ -486,7 +599,7 @@ elif choice == "Advanced Analytics":
 
             # Top Selling Medicines
             st.subheader("Top Selling Medicines")
-            top_meds = filtered_df.groupby("Medicine")["Qty"].sum().nlargest(5)
+            top_meds = analytics.top_medicines(start_key, end_key)
             if top_meds.empty:
                 st.warning("No medicine sales data.")
             else:
@@ -494,11 +607,11 @@ elif choice == "Advanced Analytics":
 
             # Customer Purchase Analysis
             st.subheader("Customer Purchase Analysis")
-            top_customers = filtered_df.groupby("Customer")["Total"].sum().nlargest(5)
-            if top_customers.empty:
+            top_custs = analytics.top_customers(start_key, end_key)
+            if top_custs.empty:
                 st.warning("No customer purchase data.")
             else:
-                st.bar_chart(top_customers)
+                st.bar_chart(top_custs)
 
         except Exception as e:
             st.error(f"Error processing sales data: {e}")
@@ -508,33 +621,22 @@ elif choice == "Advanced Analytics":
 elif choice == "Medicine Recommender":
     st.markdown('<h3 class="stHeader">AI Medicine Recommender 🤖</h3>', unsafe_allow_html=True)
 
-    # Load the built-in dataset (already available internally)
-    @st.cache_data
-    def load_data():
-        return pd.read_csv("C:\\Users\\Shlokam\\Desktop\\Static\\medicine_data.csv")  # Adjust if path is different
-
-    data = load_data()
+    # Load the trained model once per process; the dataset's modification time
+    # is part of the cache key so an updated dataset is picked up (and, if its
+    # hash changed, retrained) without restarting the server
+    # Imported here: numpy/scipy and the model are only needed on this page
+    import recommender
 
-    # Handle multiple symptoms properly
-    X = data['symptoms']
-    y = data['medicine']
+    @st.cache_resource
+    def load_recommender(data_mtime):
+        return recommender.load_model()
 
-    # Create pipeline: text vectorizer + SVM
-    from sklearn.svm import SVC
-    from sklearn.feature_extraction.text import CountVectorizer
-    from sklearn.pipeline import make_pipeline
+    artifact = load_recommender(os.path.getmtime(recommender.DATA_PATH))
+    model = artifact["model"]
+    known_symptoms = artifact["known_symptoms"]
 
-    model = make_pipeline(CountVectorizer(), SVC(kernel='linear', probability=True))
-    model.fit(X, y)
-
-    
     user_symptoms = st.text_area("Enter symptoms (comma separated)", placeholder="e.g. cough, fever, headache")
 
-    
-    known_symptoms = set()
-    for symptom_list in data['symptoms']:
-        known_symptoms.update(symptom.strip().lower() for symptom in symptom_list.split(','))
-
     if st.button("Recommend Medicine"):
         if not user_symptoms.strip():
             st.error("Please enter at least one symptom.")
@@ -548,11 +650,9 @@ elif choice == "Medicine Recommender":
             else:
                 try:
                     
-                    prediction = model.predict([user_symptoms])
-                    probas = model.predict_proba([user_symptoms])[0]
-                    top_meds = sorted(zip(model.classes_, probas), key=lambda x: x[1], reverse=True)[:3]
+                    prediction, top_meds = model.recommend(user_symptoms, k=3)
 
-                    st.success(f"Recommended Medicine: {prediction[0]}")
+                    st.success(f"Recommended Medicine: {prediction}")
                     st.markdown("#### Top Suggestions:")
                     for med, prob in top_meds:
                         st.write(f"- {med} ({prob*100:.1f}%)")
@@ -566,31 +666,119 @@ elif choice == "Medicine Recommender":
 elif choice == "Alerts":
     st.markdown('<h3 class="stHeader">Medicine Alerts ⚠️</h3>', unsafe_allow_html=True)
 
-  
-    medicines = fetch_medicines()
-
-    
-    low_stock_threshold = 10
-    expiry_warning_threshold = pd.to_datetime("today") + pd.DateOffset(weeks=1)  
-
-    
-    low_stock_meds = [med for med in medicines if med[5] <= low_stock_threshold]
+    columns = ["ID", "Name", "Category", "Buy_price", "Sell_price", "Stock", "Expiry_date"]
+    low_stock_meds = fetch_alerts("low_stock")
+    expiring_meds = fetch_alerts("expiring", "expired")
 
-    
-    expiring_meds = [med for med in medicines if pd.to_datetime(med[6]) <= expiry_warning_threshold]
-
-   
     if low_stock_meds:
         st.subheader("Medicines with Low Stock")
-        low_stock_df = pd.DataFrame(low_stock_meds, columns=["ID", "Name", "Category", "Buy_price", "Sell_price", "Stock", "Expiry_date"])
+        low_stock_df = pd.DataFrame(low_stock_meds, columns=columns)
         st.dataframe(low_stock_df, height=200)
     else:
         st.write("No medicines are low in stock.")
 
-   
     if expiring_meds:
         st.subheader("Medicines Expiring Soon")
-        expiring_df = pd.DataFrame(expiring_meds, columns=["ID", "Name", "Category", "Buy_price", "Sell_price", "Stock", "Expiry_date"])
+        expiring_df = pd.DataFrame(expiring_meds, columns=columns)
         st.dataframe(expiring_df, height=200)
     else:
-        st.write("No medicines are expiring soon.")
\ No newline at end of file
+        st.write("No medicines are expiring soon.")
+
+    with st.expander("Alert Thresholds"):
+        st.caption(
+            f"Defaults: low stock at {DEFAULT_LOW_STOCK} units or fewer, "
+            f"expiring within {DEFAULT_EXPIRY_DAYS} days. Leave a value at 0 to keep the default."
+        )
+        thresholds = fetch_alert_thresholds()
+        if thresholds:
+            st.dataframe(
+                pd.DataFrame(thresholds, columns=["ID", "Category", "Medicine", "Low Stock", "Expiry Days"]),
+                height=150
+            )
+
+        scope = st.radio("Applies to", ["Category", "Medicine"], horizontal=True)
+        if scope == "Category":
+            target = st.text_input("Category")
+        else:
+            meds = medicine_catalog()
+            target = search_picker("Medicine", search_medicines, "threshold_medicine")
+        low_stock = st.number_input("Low Stock Threshold", min_value=0, step=1)
+        expiry_days = st.number_input("Expiry Warning (days)", min_value=0, step=1)
+        if st.button("Save Threshold"):
+            if target is None or not str(target).strip():
+                st.error(f"{scope} cannot be empty.")
+            else:
+                set_alert_threshold(
+                    category=target.strip() if scope == "Category" else None,
+                    medicine_id=target if scope == "Medicine" else None,
+                    low_stock=low_stock or None,
+                    expiry_days=expiry_days or None
+                )
+                st.success(f"Threshold saved for {target if scope == 'Category' else meds.names[target]}.")
+                st.rerun()
+
+        if thresholds:
+            remove = st.selectbox("Remove Threshold", [t[0] for t in thresholds],
+                                  format_func=lambda tid: next(t[1] or t[2] for t in thresholds if t[0] == tid))
+            if st.button("Remove Threshold"):
+                delete_alert_threshold(remove)
+                st.rerun()
+
+elif choice == "Reorder Planner":
+    st.markdown('<h3 class="stHeader">Reorder Planner 📦</h3>', unsafe_allow_html=True)
+    st.caption("Daily demand is forecast for every medicine from its sales history; the reorder point "
+               "covers the lead time plus safety stock, and orders top stock up for the review period.")
+
+    col1, col2, col3 = st.columns(3)
+    method = col1.selectbox("Forecast Method", forecasting.METHODS)
+    if method == "Moving average":
+        window = col2.number_input("Average Over (days)", min_value=1, max_value=365, value=28, step=1)
+        alpha = 0.3
+    else:
+        alpha = col2.slider("Smoothing Factor", min_value=0.05, max_value=0.95, value=0.3, step=0.05)
+        window = 28
+    history_days = col3.number_input("History (days)", min_value=window, max_value=3 * 365, value=max(365, window), step=1)
+    col1, col2, col3 = st.columns(3)
+    lead_time = col1.number_input("Lead Time (days)", min_value=1, value=7, step=1)
+    review_days = col2.number_input("Review Period (days)", min_value=0, value=14, step=1)
+    service_level = col3.slider("Service Level", min_value=0.5, max_value=0.999, value=0.95, step=0.005)
+
+    plan = forecasting.reorder_plan(lead_time, review_days, service_level, history_days, method, alpha, window)
+    to_order = plan[plan["Order Quantity"] > 0].sort_values("Days of Cover")
+    show_all = st.checkbox("Show all medicines")
+    shown = plan.sort_values("Days of Cover") if show_all else to_order
+
+    st.metric("Medicines to Reorder", len(to_order))
+    if shown.empty:
+        st.write("Nothing needs reordering.")
+    else:
+        if len(shown) > PLANNER_PREVIEW_ROWS:
+            st.caption(f"Showing the {PLANNER_PREVIEW_ROWS} with the fewest days of cover; download for all {len(shown)}.")
+        st.dataframe(shown.head(PLANNER_PREVIEW_ROWS), height=400)
+        st.download_button("Download Plan (CSV)", shown.to_csv().encode("utf-8"), "reorder_plan.csv", "text/csv")
+
+# ─── QUERY PROFILER RESULTS ────────────────────────────────────────────────────
+page_queries = end_query_capture(choice)
+if profiling:
+    with profiler_panel:
+        st.metric("Queries this rerun", len(page_queries), f"{sum(q.ms for q in page_queries):.1f} ms", delta_color="off")
+        if page_queries:
+            st.dataframe(pd.DataFrame(
+                [(q.caller, q.ms, q.rows, q.sql) for q in page_queries],
+                columns=["Caller", "ms", "Rows", "SQL"]
+            ), hide_index=True)
+        stats = page_query_stats()
+        if stats:
+            st.caption("Per page (average per rerun)")
+            st.dataframe(pd.DataFrame(
+                [(page, s["reruns"], s["queries"] / s["reruns"], s["ms"] / s["reruns"]) for page, s in stats.items()],
+                columns=["Page", "Reruns", "Queries", "ms"]
+            ).sort_values("ms", ascending=False), hide_index=True)
+        if slow_queries:
+            st.caption(f"Slow queries (≥ {slow_ms:g} ms)")
+            for q in reversed(list(slow_queries)):
+                st.code(f"{q.ms:.1f} ms, {q.rows} rows, {q.caller}\n{q.sql}" +
+                        ("" if q.plan is None else "\n-- " + "\n-- ".join(q.plan)), language="sql")
+        if st.button("Reset Query Stats"):
+            reset_query_stats()
+            st.rerun()
@@ -0,0 +1,491 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import analytics
+import database
+import forecasting
+import prescriptions
+import recommender
+import synthetic_data
+
+
+# Run `fn` until `min_time` seconds have passed (at least once, at most
+# `max_runs` times) and return latency statistics in milliseconds
+def measure(fn, min_time=0.5, max_runs=1000):
+    times = []
+    deadline = time.perf_counter() + min_time
+    while not times or (time.perf_counter() < deadline and len(times) < max_runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "runs": len(times),
+        "mean_ms": sum(times) / len(times) * 1e3,
+        "min_ms": times[0] * 1e3,
+        "p50_ms": times[len(times) // 2] * 1e3,
+    }
+
+
+# Per-call latency of a fresh sqlite3.connect() per query versus the pooled connection
+def bench_connections(min_time):
+    def fresh_connection():
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute("SELECT COUNT(*) FROM medicines").fetchone()
+        conn.close()
+
+    def pooled_connection():
+        database.connect_db().execute("SELECT COUNT(*) FROM medicines").fetchone()
+
+    return {
+        "connect_fresh_per_query": measure(fresh_connection, min_time),
+        "connect_pooled_per_query": measure(pooled_connection, min_time),
+    }
+
+
+# Dashboard metrics: the seven separate calls it used to make versus one cached summary
+def bench_dashboard(min_time):
+    def separate_calls():
+        len(database.fetch_medicines())
+        len(database.fetch_customers())
+        database.fetch_sales()
+        database.calculate_total_sales()
+        database.calculate_total_profit()
+        database.medicines_expiring_this_week()
+
+    return {
+        "dashboard_separate_calls": measure(separate_calls, min_time),
+        "dashboard_summary_cached": measure(database.dashboard_summary, min_time),
+    }
+
+
+# Cost of query instrumentation: the same page reads with it off and on
+def bench_instrumentation(min_time):
+    def page_reads():
+        database.fetch_medicines_page(50)
+        database.fetch_recent_sales(5)
+        database.fetch_alerts("low_stock")
+
+    enabled, slow_ms, explain = database.query_instrumentation()
+    database.set_query_instrumentation(False)
+    results = {"query_instrumentation_off": measure(page_reads, min_time)}
+    database.set_query_instrumentation(True, slow_query_ms=float("inf"))
+    results["query_instrumentation_on"] = measure(page_reads, min_time)
+    database.set_query_instrumentation(enabled, slow_ms, explain)
+    return results
+
+
+# Reorder planning: the whole pipeline on the benchmark database, and the
+# vectorised forecasting core at 50k medicines × 3 years of daily history
+def bench_forecasting(min_time, medicines=50000, days=3 * 365, density=0.1, seed=3):
+    import numpy as np
+
+    forecasting.reorder_plan()
+    results = {
+        "reorder_plan": measure(forecasting.reorder_plan, min_time),
+        "reorder_plan_moving_average": measure(lambda: forecasting.reorder_plan(method="Moving average"), min_time),
+    }
+
+    # Long-form demand: each medicine sells on about `density` of the days
+    rng = np.random.default_rng(seed)
+    rows = int(medicines * days * density)
+    positions = rng.integers(0, medicines, rows)
+    ages = rng.integers(0, days, rows)
+    quantities = rng.geometric(0.3, rows).astype(np.float64)
+    results["forecast_50k_3y_rows"] = rows
+    for method, short in zip(forecasting.METHODS, ["smoothing", "moving_avg"]):
+        results[f"forecast_50k_3y_{short}"] = measure(
+            lambda: forecasting.demand_stats(positions, ages, quantities, medicines, days, method), min_time, max_runs=20
+        )
+    return results
+
+
+# Runs `code` in `runs` fresh interpreters; the code prints its own elapsed
+# milliseconds, so interpreter start-up itself is not counted
+def _cold_start(code, runs):
+    env = dict(os.environ, PHARMACY_DB=database.DB_PATH)
+    here = os.path.dirname(os.path.abspath(__file__))
+    prelude = "import time\nstart = time.perf_counter()\n"
+    epilogue = "\nprint((time.perf_counter() - start) * 1e3)\n"
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", prelude + code + epilogue], cwd=here, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        times.append(float(out.split()[-1]))
+    times.sort()
+    return {
+        "runs": runs,
+        "mean_ms": sum(times) / runs,
+        "min_ms": times[0],
+        "p50_ms": times[runs // 2],
+    }
+
+
+# Cold start: import time of the modules the app loads and the time for a new
+# process to run app3.py up to the login screen
+def bench_startup(runs=3):
+    login_screen = (
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file(os.path.abspath('app3.py'), default_timeout=60).run()\n"
+        "assert not at.exception, at.exception\n"
+    )
+    return {
+        "startup_import_database": _cold_start("import database", runs),
+        "startup_import_streamlit": _cold_start("import streamlit", runs),
+        "startup_import_recommender": _cold_start("import recommender", runs),
+        "startup_time_to_login_screen": _cold_start("import os\n" + login_screen, runs),
+    }
+
+
+# Synthetic symptom/medicine dataset: each medicine treats a few symptoms
+def write_symptom_dataset(path, medicines=40, symptoms=80, rows=600, seed=7):
+    import random
+    rng = random.Random(seed)
+    vocab = [f"symptom{i}" for i in range(symptoms)]
+    treats = {f"Medicine{m}": rng.sample(vocab, 6) for m in range(medicines)}
+    lines = ["symptoms,medicine"]
+    for _ in range(rows):
+        med = rng.choice(list(treats))
+        picked = rng.sample(treats[med], rng.randint(1, 3))
+        lines.append('"' + ", ".join(picked) + '",' + med)
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+# Recommender cost: training, loading the saved artifact, and inference latency
+def bench_recommender(tmp):
+    data_path = os.path.join(tmp, "medicine_data.csv")
+    write_symptom_dataset(data_path)
+    recommender.MODEL_DIR = os.path.join(tmp, "models")
+
+    start = time.perf_counter()
+    recommender.train_and_save(data_path)
+    fit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = recommender.load_model(data_path)["model"]
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.recommend("symptom1, symptom2")
+    first_s = time.perf_counter() - start
+
+    # Bulk triage: many queries scored in one pass
+    queries = [f"symptom{i % 80}, symptom{(i * 7) % 80}" for i in range(10000)]
+    start = time.perf_counter()
+    model.recommend_batch(queries)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "recommender_fit_ms": fit_s * 1e3,
+        "recommender_artifact_load_ms": load_s * 1e3,
+        "recommender_first_recommendation_ms": first_s * 1e3,
+        "recommender_batch_per_query_us": batch_s / len(queries) * 1e6,
+    }
+
+
+SAMPLE_PRESCRIPTION = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "A-sample-prescription-image-in-grayscale-version.png")
+
+
+# `count` phone-camera sized colour JPEGs taken sideways (EXIF orientation 6),
+# made from the sample prescription when it is there and from noise otherwise
+def write_prescription_photos(directory, count, size=(4032, 3024)):
+    from PIL import Image, ImageFilter
+
+    if os.path.exists(SAMPLE_PRESCRIPTION):
+        # Softened first: enlarging its dithering would make a file no camera writes
+        with Image.open(SAMPLE_PRESCRIPTION) as sample:
+            photo = sample.convert("RGB").filter(ImageFilter.GaussianBlur(1)).rotate(90, expand=True).resize(size)
+    else:
+        photo = Image.effect_noise(size, 64).convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    first = os.path.join(directory, "photo-0.jpg")
+    photo.save(first, "JPEG", quality=92, exif=exif)
+    paths = [first]
+    for i in range(1, count):
+        paths.append(os.path.join(directory, f"photo-{i}.jpg"))
+        with open(first, "rb") as src, open(paths[-1], "wb") as dst:
+            dst.write(src.read())
+    return paths
+
+
+# Prescription images per second through the processing pipeline, in this
+# process and on the worker pool (pool start-up included, as in batch runs),
+# and the cost of the upload preview thumbnail
+def bench_prescriptions(tmp, count=24):
+    directory = os.path.join(tmp, "prescriptions")
+    os.makedirs(directory)
+    jobs = [(path, f"{path}.view.jpg", f"{path}.thumb.jpg")
+            for path in write_prescription_photos(directory, count)]
+
+    results = {}
+    for workers in sorted({1, prescriptions.WORKERS}):
+        start = time.perf_counter()
+        failed = sum(1 for _, _, error in prescriptions.process_batch(jobs, workers) if error)
+        if failed:
+            raise RuntimeError(f"{failed} benchmark image(s) failed to process")
+        results[f"prescription_images_per_s_{workers}_workers"] = count / (time.perf_counter() - start)
+
+    def preview():
+        with open(jobs[0][0], "rb") as f:
+            prescriptions.thumbnail_bytes(f)
+    results["prescription_preview_thumbnail"] = measure(preview, max_runs=20)
+    results["prescription_original_kb"] = os.path.getsize(jobs[0][0]) / 1024
+    results["prescription_view_kb"] = os.path.getsize(jobs[0][1]) / 1024
+    results["prescription_thumbnail_kb"] = os.path.getsize(jobs[0][2]) / 1024
+    return results
+
+
+# Every public function in database.py, and the analytics page readers,
+# with representative arguments.
+# Write functions run last; they add rows, so point --db at a copy.
+def bench_public_api(min_time):
+    today = datetime.now().strftime('%Y-%m-%d')
+    first_day, last_day = analytics.sales_date_range() or (today, today)
+    month_start = last_day[:8] + "01"
+    medicine_id = database.fetch_medicines_page(1)[0][0]
+    customer_id = database.fetch_customers_page(1)[0][0]
+    medicine = database.fetch_medicines_page(1)[0]
+
+    def uncached_summary():
+        database._summary_cache.clear()
+        database.dashboard_summary()
+
+    reads = {
+        "fetch_medicines": database.fetch_medicines,
+        "fetch_customers": database.fetch_customers,
+        "fetch_sales": database.fetch_sales,
+        "fetch_medicines_page": lambda: database.fetch_medicines_page(50, after_id=medicine_id),
+        "fetch_customers_page": lambda: database.fetch_customers_page(50, after_id=customer_id),
+        "fetch_recent_sales": lambda: database.fetch_recent_sales(5),
+        "calculate_total_sales": database.calculate_total_sales,
+        "calculate_total_profit": database.calculate_total_profit,
+        "medicines_expiring_this_week": database.medicines_expiring_this_week,
+        "dashboard_summary": database.dashboard_summary,
+        "dashboard_summary_uncached": uncached_summary,
+        "sales_date_range": analytics.sales_date_range,
+        "sales_over_time_daily": lambda: analytics.sales_over_time(first_day, last_day, "Daily"),
+        "sales_over_time_monthly": lambda: analytics.sales_over_time(first_day, last_day, "Monthly"),
+        "top_medicines": lambda: analytics.top_medicines(first_day, last_day),
+        "top_customers": lambda: analytics.top_customers(first_day, last_day),
+        "generate_report_month": lambda: database.generate_report(month_start, last_day),
+        "iter_report_month": lambda: sum(len(rows) for rows in database.iter_report(month_start, last_day)),
+        "fetch_alerts": lambda: database.fetch_alerts("low_stock"),
+        "fetch_lots": lambda: database.fetch_lots(medicine_id),
+        "refresh_alerts": database.refresh_alerts,
+        "medicine_catalog": database.medicine_catalog,
+        "customer_catalog": database.customer_catalog,
+        "search_medicines_one_letter": lambda: database.search_medicines("m"),
+        "search_medicines_two_words": lambda: database.search_medicines("medicine 12"),
+        "search_customers_one_letter": lambda: database.search_customers("c"),
+        "medicine_catalog_rebuild": lambda: (database._invalidate_catalog("medicines"), database.medicine_catalog()),
+    }
+    # Catalog lookups are timed warm; medicine_catalog_rebuild times a cold build
+    database.medicine_catalog()
+    database.customer_catalog()
+    results = {name: measure(fn, min_time) for name, fn in reads.items()}
+
+    added = []
+
+    def add_medicine():
+        database.add_medicine("Benchmark Medicine", "Benchmark", 1.0, 2.0, 1000, "2099-01-01")
+        if not added:
+            added.append(database.fetch_medicines_page(1, before_id=sys.maxsize)[0][0])
+
+    writes = {
+        "add_medicine": add_medicine,
+        "add_customer": lambda: database.add_customer("Benchmark Customer", "9999999999", "Bench"),
+        "update_medicine": lambda: database.update_medicine(medicine_id, *medicine[1:]),
+        "update_customer": lambda: database.update_customer(customer_id, "Customer 0", "9999999999", "Bench"),
+        "add_lot": lambda: database.add_lot(added[0], 1, "2099-01-01"),
+        "record_sale": lambda: database.record_sale(customer_id, added[0], 1),
+        "record_sales_batch_5_lines": lambda: database.record_sales_batch(customer_id, [(added[0], 1)] * 5),
+    }
+    for name, fn in writes.items():
+        results[name] = measure(fn, min_time, max_runs=200)
+
+    # Analytics frame refresh: nothing new, and one new sale to append
+    def refresh_after_sale():
+        database.record_sale(customer_id, added[0], 1)
+        start = time.perf_counter()
+        analytics.sales_frames()
+        return time.perf_counter() - start
+
+    database.add_lot(added[0], 1000, "2099-01-01")
+    analytics.sales_frames()
+    results["analytics_refresh_unchanged"] = measure(analytics.sales_frames, min_time)
+    times = sorted(refresh_after_sale() for _ in range(50))
+    results["analytics_refresh_after_sale"] = {
+        "runs": len(times),
+        "mean_ms": sum(times) / len(times) * 1e3,
+        "min_ms": times[0] * 1e3,
+        "p50_ms": times[len(times) // 2] * 1e3,
+    }
+    return results
+
+
+# Sales per second recorded by `writers` threads selling for `duration` seconds
+def _write_throughput(writers, duration, customer_id, medicine_id):
+    counts = [0] * writers
+    deadline = time.perf_counter() + duration
+
+    def writer(i):
+        while time.perf_counter() < deadline:
+            database.record_sale(customer_id, medicine_id, 1)
+            counts[i] += 1
+        database.close_db()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+# Sale throughput with many concurrent writers, through the group-commit
+# writer and with one commit per call on each writer's own connection
+def bench_write_concurrency(min_time, writer_counts=(1, 8, 32)):
+    customer_id = database.fetch_customers_page(1)[0][0]
+    medicine_id = database.add_medicine("Concurrency Medicine", "Benchmark", 1.0, 2.0, 0, "2099-01-01")
+    database.add_lot(medicine_id, 10 ** 9, "2099-01-01")
+    duration = max(min_time, 1.0)
+
+    results = {}
+    saved = database.GROUP_COMMIT
+    try:
+        for group_commit, mode in [(False, "commit_per_call"), (True, "group_commit")]:
+            database.GROUP_COMMIT = group_commit
+            for writers in writer_counts:
+                results[f"sales_per_s_{mode}_{writers}_writers"] = _write_throughput(
+                    writers, duration, customer_id, medicine_id
+                )
+    finally:
+        database.GROUP_COMMIT = saved
+    return results
+
+
+# What each Streamlit page reads from the database on one rerun
+def bench_pages(min_time):
+    today = datetime.now().strftime('%Y-%m-%d')
+    first_day, last_day = analytics.sales_date_range() or (today, today)
+
+    def record_sale_page():
+        database.customer_catalog()
+        database.medicine_catalog()
+        database.search_customers("")
+        database.search_medicines("")
+
+    def analytics_page():
+        analytics.sales_date_range()
+        analytics.sales_over_time(first_day, last_day, "Monthly")
+        analytics.top_medicines(first_day, last_day)
+        analytics.top_customers(first_day, last_day)
+
+    pages = {
+        "page_dashboard": lambda: (database.dashboard_summary(), database.fetch_recent_sales(6)),
+        "page_manage_medicines": lambda: (database.medicine_catalog(), database.search_medicines(""),
+                                          database.fetch_medicines_page(51)),
+        "page_manage_customers": lambda: (database.customer_catalog(), database.search_customers(""),
+                                          database.fetch_customers_page(51)),
+        "page_record_sale": record_sale_page,
+        "page_generate_report_preview": lambda: next(database.iter_report(first_day, last_day, 200), []),
+        "page_advanced_analytics": analytics_page,
+        "page_alerts": lambda: (database.fetch_alerts("low_stock"), database.fetch_alerts("expiring", "expired")),
+    }
+    return {name: measure(fn, min_time) for name, fn in pages.items()}
+
+
+def table_counts():
+    c = database.connect_db().cursor()
+    counts = {}
+    for table in ["medicines", "customers", "sales"]:
+        c.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = c.fetchone()[0]
+    return counts
+
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    print(f"\n{'benchmark':35s} {'before':>10s} {'after':>10s} {'change':>8s}")
+    for name, stats in results.items():
+        before = previous.get(name)
+        if not isinstance(stats, dict) or not isinstance(before, dict):
+            continue
+        change = (stats["mean_ms"] / before["mean_ms"] - 1) * 100 if before["mean_ms"] else 0.0
+        print(f"{name:35s} {before['mean_ms']:10.3f} {stats['mean_ms']:10.3f} {change:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pharmacy data layer")
+    parser.add_argument("--db", help="benchmark an existing database (a copy is advisable: writes are timed too)")
+    parser.add_argument("--medicines", type=int, default=2000, help="synthetic medicines when --db is not given")
+    parser.add_argument("--customers", type=int, default=5000, help="synthetic customers when --db is not given")
+    parser.add_argument("--sales", type=int, default=100000, help="synthetic sales when --db is not given")
+    parser.add_argument("--years", type=int, default=3, help="years of synthetic sales history")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend timing each function")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    parser.add_argument("--skip-micro", action="store_true", help="skip connection, recommender and prescription image micro-benchmarks")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            database.configure_db(args.db)
+        else:
+            database.configure_db(os.path.join(tmp, "bench.db"))
+            start = time.perf_counter()
+            synthetic_data.generate(args.medicines, args.customers, args.sales, args.years)
+            print(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
+
+        results = {}
+        results.update(bench_public_api(args.min_time))
+        results.update(bench_pages(args.min_time))
+        results.update(bench_forecasting(args.min_time))
+        results.update(bench_write_concurrency(args.min_time))
+        if not args.skip_micro:
+            results.update(bench_connections(args.min_time))
+            results.update(bench_dashboard(args.min_time))
+            results.update(bench_instrumentation(args.min_time))
+            results.update(bench_startup())
+            results.update(bench_recommender(tmp))
+            results.update(bench_prescriptions(tmp))
+        counts = table_counts()
+        database.close_db()
+
+    for name, value in results.items():
+        if isinstance(value, dict):
+            print(f"{name:35s} {value['mean_ms']:10.3f} ms  ({value['runs']} runs)")
+        else:
+            print(f"{name:35s} {value:10.1f}")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "tables": counts,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
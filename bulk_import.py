@@ -0,0 +1,67 @@
+import csv
+from datetime import datetime
+
+from database import add_customers_bulk, add_medicines_bulk
+from validation import customer_error, medicine_error
+
+MEDICINE_COLUMNS = ["name", "category", "buy_price", "sell_price", "stock", "expiry_date"]
+CUSTOMER_COLUMNS = ["name", "contact", "address"]
+
+
+def _records(f, columns):
+    reader = csv.DictReader(f)
+    missing = [col for col in columns if col not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+    # Line 1 is the header, so data rows start at line 2
+    return enumerate(reader, start=2)
+
+
+def _medicine_rows(f, errors):
+    for line, rec in _records(f, MEDICINE_COLUMNS):
+        try:
+            name, category = rec["name"] or "", rec["category"] or ""
+            buy_price = float(rec["buy_price"])
+            sell_price = float(rec["sell_price"])
+            stock = int(rec["stock"])
+            expiry_date = datetime.strptime(rec["expiry_date"].strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+        except (TypeError, ValueError, AttributeError):
+            errors.append((line, "Prices and stock must be numbers and Expiry Date must be YYYY-MM-DD."))
+            continue
+        error = medicine_error(name, category, buy_price, sell_price, stock)
+        if error:
+            errors.append((line, error))
+            continue
+        yield name.strip(), category.strip(), buy_price, sell_price, stock, expiry_date
+
+
+def _customer_rows(f, errors):
+    for line, rec in _records(f, CUSTOMER_COLUMNS):
+        name, contact, address = (rec[col] or "" for col in CUSTOMER_COLUMNS)
+        error = customer_error(name, contact, address)
+        if error:
+            errors.append((line, error))
+            continue
+        yield name.strip(), contact.strip(), address.strip()
+
+
+# Stream a medicines CSV (text file object) into the database. Valid rows are
+# inserted in one transaction; returns (rows inserted, [(line, error), ...]).
+def import_medicines(f, batch_size=10000):
+    errors = []
+    inserted = add_medicines_bulk(_medicine_rows(f, errors), batch_size)
+    return inserted, errors
+
+
+# Stream a customers CSV (text file object) into the database. Valid rows are
+# inserted in one transaction; returns (rows inserted, [(line, error), ...]).
+def import_customers(f, batch_size=10000):
+    errors = []
+    inserted = add_customers_bulk(_customer_rows(f, errors), batch_size)
+    return inserted, errors
+
+
+IMPORTERS = {
+    "medicines": import_medicines,
+    "customers": import_customers,
+}
@@ -1,56 +1,825 @@
+import collections
+import logging
+import os
+import queue
+import re
+import shutil
 import sqlite3
-import pandas as pd
+import sys
+import threading
+import time
+import prescriptions
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
-# Connect to SQLite database and create tables if they don't exist
-conn = sqlite3.connect('pharmacy.db')
-c = conn.cursor()
-
-# Create medicines table
-c.execute('''CREATE TABLE IF NOT EXISTS medicines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                buy_price REAL NOT NULL,
-                sell_price REAL NOT NULL,
-                stock INTEGER NOT NULL,
-                expiry_date TEXT NOT NULL
-            )''')
-
-# Create customers table
-c.execute('''CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT NOT NULL,
-                address TEXT NOT NULL
-            )''')
-
-# Create sales table with prescription column
-c.execute('''CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_id INTEGER NOT NULL,
-                medicine_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                total REAL NOT NULL,
-                date TEXT NOT NULL,
-                prescription TEXT,
-                FOREIGN KEY(customer_id) REFERENCES customers(id),
-                FOREIGN KEY(medicine_id) REFERENCES medicines(id)
-            )''')
-
-# If the sales table existed without prescription column, add it
-try:
-    c.execute("ALTER TABLE sales ADD COLUMN prescription TEXT")
-except sqlite3.OperationalError:
-    # Column already exists
-    pass
-
-conn.commit()
-conn.close()
-
-# Helper function to create a new connection
+# Path of the SQLite database file, overridable with PHARMACY_DB or configure_db()
+DB_PATH = os.environ.get('PHARMACY_DB', 'pharmacy.db')
+
+# Pragmas applied once to every pooled connection when it is opened
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,       # ~20 MB page cache (negative = KiB)
+    'mmap_size': 268435456,     # 256 MB memory-mapped I/O
+    'busy_timeout': 5000,       # wait up to 5 s on a locked database
+    'temp_store': 'MEMORY',
+}
+
+# Idle connections kept around for reuse by new script threads
+POOL_SIZE = 8
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+_generation = 0
+_config_lock = threading.Lock()
+
+
+def _open_connection(path):
+    factory = _InstrumentedConnection if INSTRUMENT_QUERIES else sqlite3.Connection
+    conn = sqlite3.connect(path, check_same_thread=False, factory=factory)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def _release(conn, generation):
+    # Hand a connection back to the pool, or close it if the pool is full or
+    # the database path has changed since it was opened.
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        if generation != _generation:
+            raise queue.Full
+        _pool.put_nowait((conn, generation))
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
+
+class _Lease:
+    # Holds a pooled connection for the lifetime of one thread. Streamlit runs
+    # every rerun on a fresh script thread; when that thread finishes its
+    # thread-local lease is dropped and the connection goes back to the pool.
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+    def __del__(self):
+        _release(self.conn, self.generation)
+
+
+def _acquire():
+    while True:
+        try:
+            conn, generation = _pool.get_nowait()
+        except queue.Empty:
+            return _Lease(_open_connection(DB_PATH), _generation)
+        if generation == _generation:
+            return _Lease(conn, generation)
+        conn.close()
+
+
+# ─── QUERY INSTRUMENTATION ─────────────────────────────────────────────────────
+# When enabled, pooled connections are opened with a cursor class that times
+# every statement (including the time spent fetching its rows). When disabled
+# connections are plain sqlite3 ones, so there is no overhead at all.
+
+INSTRUMENT_QUERIES = os.environ.get('PHARMACY_PROFILE_SQL') == '1'
+SLOW_QUERY_MS = float(os.environ.get('PHARMACY_SLOW_QUERY_MS', 100))
+EXPLAIN_SLOW_QUERIES = False
+
+slow_query_logger = logging.getLogger("pharmacy.slow_queries")
+prescription_logger = logging.getLogger("pharmacy.prescriptions")
+
+# Most recent slow queries, newest last, for display in the app
+slow_queries = collections.deque(maxlen=50)
+
+# Per-page totals across reruns: page -> {"reruns", "queries", "ms"}
+_page_stats = {}
+_stats_lock = threading.Lock()
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+
+
+class QueryRecord:
+    __slots__ = ("sql", "params", "ms", "rows", "caller", "plan", "logged")
+
+    def __init__(self, sql, params, caller):
+        self.sql = " ".join(sql.split())
+        self.params = params
+        self.ms = 0.0
+        self.rows = 0
+        self.caller = caller
+        self.plan = None
+        self.logged = False
+
+
+_INSTRUMENTATION_FRAMES = {"_caller", "_timed", "execute", "executemany", "fetchone", "fetchmany", "fetchall"}
+
+
+def _caller():
+    # Nearest database.py function that issued the query, or failing that the
+    # first frame outside sqlite3/pandas (e.g. a line in app3.py)
+    frame = sys._getframe(1)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.normcase(os.path.abspath(code.co_filename))
+        if filename == _THIS_FILE:
+            if code.co_name not in _INSTRUMENTATION_FRAMES:
+                return f"{code.co_name}:{frame.f_lineno}"
+        elif fallback is None and "pandas" not in filename and "sqlite3" not in filename:
+            fallback = f"{os.path.basename(filename)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return fallback or "?"
+
+
+def _finish(cursor, record, started, rows, done=True):
+    record.ms += (time.perf_counter() - started) * 1e3
+    record.rows += rows
+    if done and record.ms >= SLOW_QUERY_MS and not record.logged:
+        record.logged = True
+        if EXPLAIN_SLOW_QUERIES and record.sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                plan = sqlite3.Cursor(cursor.connection).execute(
+                    "EXPLAIN QUERY PLAN " + record.sql, record.params or ()
+                ).fetchall()
+                record.plan = [row[-1] for row in plan]
+            except sqlite3.Error:
+                pass
+        slow_queries.append(record)
+        slow_query_logger.warning(
+            "slow query %.1f ms (%s rows) in %s: %s%s", record.ms, record.rows, record.caller, record.sql,
+            "" if record.plan is None else "\n  plan: " + "; ".join(record.plan)
+        )
+
+
+class _InstrumentedCursor(sqlite3.Cursor):
+    _record = None
+
+    def _timed(self, method, sql, params, many=False):
+        record = QueryRecord(sql, None if many else params, _caller())
+        queries = getattr(_local, "queries", None)
+        if queries is not None:
+            queries.append(record)
+        self._record = record
+        started = time.perf_counter()
+        result = method(sql, params)
+        # Queries returning rows are judged once their rows have been fetched
+        _finish(self, record, started, max(self.rowcount, 0), done=self.description is None)
+        return result
+
+    def execute(self, sql, params=()):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(super().executemany, sql, seq_of_params, many=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._record is not None:
+            _finish(self, self._record, started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._record is not None:
+            _finish(self, self._record, started, len(rows), done=len(rows) < (size or self.arraysize))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._record is not None:
+            _finish(self, self._record, started, len(rows))
+        return rows
+
+    # `for row in cursor` reads through here
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._record is not None:
+                _finish(self, self._record, started, 0)
+            raise
+        if self._record is not None:
+            _finish(self, self._record, started, 1, done=False)
+        return row
+
+    # A loop that stops early closes the cursor, which ends the query
+    def close(self):
+        if self._record is not None:
+            _finish(self, self._record, time.perf_counter(), 0)
+        super().close()
+
+
+class _InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=_InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+# Turn instrumentation on or off for this process. Pooled connections are
+# reopened so the change applies to every thread from its next query.
+def set_query_instrumentation(enabled, slow_query_ms=None, explain=None):
+    global INSTRUMENT_QUERIES, SLOW_QUERY_MS, EXPLAIN_SLOW_QUERIES, _generation
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms
+    if explain is not None:
+        EXPLAIN_SLOW_QUERIES = explain
+    if enabled != INSTRUMENT_QUERIES:
+        with _config_lock:
+            INSTRUMENT_QUERIES = enabled
+            _generation += 1
+
+
+# (enabled, slow_query_ms, explain) as currently configured
+def query_instrumentation():
+    return INSTRUMENT_QUERIES, SLOW_QUERY_MS, EXPLAIN_SLOW_QUERIES
+
+
+# Start collecting the queries this thread runs (one Streamlit rerun)
+def begin_query_capture():
+    _local.queries = []
+
+
+# Stop collecting, add the rerun to the per-page totals and return its queries
+def end_query_capture(page):
+    queries = _local.__dict__.pop("queries", None) or []
+    if INSTRUMENT_QUERIES:
+        with _stats_lock:
+            stats = _page_stats.setdefault(page, {"reruns": 0, "queries": 0, "ms": 0.0})
+            stats["reruns"] += 1
+            stats["queries"] += len(queries)
+            stats["ms"] += sum(q.ms for q in queries)
+    return queries
+
+
+# Per-page query totals since the process started (or since reset)
+def page_query_stats():
+    with _stats_lock:
+        return {page: dict(stats) for page, stats in _page_stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _page_stats.clear()
+    slow_queries.clear()
+
+
+# ─── SCHEMA MIGRATIONS ─────────────────────────────────────────────────────────
+# Each step runs once, in order, inside its own transaction. PRAGMA user_version
+# stores how many steps a database file has already applied, so new steps must
+# only ever be appended to MIGRATIONS.
+
+def _create_base_tables(c):
+    # Create medicines table
+    c.execute('''CREATE TABLE IF NOT EXISTS medicines (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    buy_price REAL NOT NULL,
+                    sell_price REAL NOT NULL,
+                    stock INTEGER NOT NULL,
+                    expiry_date TEXT NOT NULL
+                )''')
+
+    # Create customers table
+    c.execute('''CREATE TABLE IF NOT EXISTS customers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    contact TEXT NOT NULL,
+                    address TEXT NOT NULL
+                )''')
+
+    # Create sales table with prescription column
+    c.execute('''CREATE TABLE IF NOT EXISTS sales (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    customer_id INTEGER NOT NULL,
+                    medicine_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    date TEXT NOT NULL,
+                    prescription TEXT,
+                    FOREIGN KEY(customer_id) REFERENCES customers(id),
+                    FOREIGN KEY(medicine_id) REFERENCES medicines(id)
+                )''')
+
+    # Older databases created the sales table without the prescription column
+    c.execute("PRAGMA table_info(sales)")
+    if "prescription" not in [col[1] for col in c.fetchall()]:
+        c.execute("ALTER TABLE sales ADD COLUMN prescription TEXT")
+
+
+def _add_hot_path_indexes(c):
+    # generate_report: range on date, covering every column the report reads
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_sales_date
+                 ON sales(date, customer_id, medicine_id, quantity, total, prescription)''')
+    # Per-medicine and per-customer lookups, covering profit and spend sums
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_medicine ON sales(medicine_id, quantity)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer ON sales(customer_id, total)")
+    # medicines_expiring_this_week: range on expiry_date
+    c.execute("CREATE INDEX IF NOT EXISTS idx_medicines_expiry ON medicines(expiry_date)")
+
+
+# `source` is the sales table, or sales plus archives from _sales_source()
+def _rebuild_rollups(c, source="sales"):
+    c.execute("DELETE FROM sales_daily_medicine")
+    c.execute("DELETE FROM sales_daily_customer")
+    c.execute(f"""
+        INSERT INTO sales_daily_medicine (day, medicine_id, quantity, revenue)
+        SELECT substr(date, 1, 10), medicine_id, SUM(quantity), SUM(total)
+        FROM {source} GROUP BY substr(date, 1, 10), medicine_id
+    """)
+    c.execute(f"""
+        INSERT INTO sales_daily_customer (day, customer_id, quantity, revenue)
+        SELECT substr(date, 1, 10), customer_id, SUM(quantity), SUM(total)
+        FROM {source} GROUP BY substr(date, 1, 10), customer_id
+    """)
+
+
+def _create_sales_rollups(c):
+    # Per-day totals maintained by record_sales_batch, so analytics scale with
+    # the number of days instead of the number of sale rows
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily_medicine (
+                    day TEXT NOT NULL,
+                    medicine_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    revenue REAL NOT NULL,
+                    PRIMARY KEY (day, medicine_id)
+                ) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily_customer (
+                    day TEXT NOT NULL,
+                    customer_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    revenue REAL NOT NULL,
+                    PRIMARY KEY (day, customer_id)
+                ) WITHOUT ROWID''')
+    _rebuild_rollups(c)
+
+
+# Row id for a stored prescription file, adding it if its content hash is not
+# known yet. Only legacy files missing from disk have no hash; they are found
+# by path.
+def _prescription_id(c, sha256, path, original_name, size):
+    c.execute(
+        "INSERT OR IGNORE INTO prescriptions (sha256, path, original_name, size, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+        (sha256, path, original_name, size, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    if sha256 is None:
+        c.execute("SELECT id FROM prescriptions WHERE path = ?", (path,))
+    else:
+        c.execute("SELECT id FROM prescriptions WHERE sha256 = ?", (sha256,))
+    return c.fetchone()[0]
+
+
+def _create_prescriptions_table(c):
+    # Each uploaded file is stored once, keyed by its content hash, and sales
+    # refer to it by id instead of repeating the path on every cart line
+    c.execute('''CREATE TABLE IF NOT EXISTS prescriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sha256 TEXT UNIQUE,
+                    path TEXT NOT NULL UNIQUE,
+                    original_name TEXT,
+                    size INTEGER,
+                    uploaded_at TEXT NOT NULL
+                )''')
+    c.execute("ALTER TABLE sales ADD COLUMN prescription_id INTEGER REFERENCES prescriptions(id)")
+
+    # Move legacy per-sale paths into the table. This replaces the fix-up the
+    # app used to run every session: files still in the old prescriptions/
+    # folder are moved to static/ once, here. They are linked (or copied) in
+    # the transaction and the originals removed only after it commits, so a
+    # failed migration loses no file and can simply run again.
+    c.execute("SELECT DISTINCT prescription FROM sales WHERE prescription IS NOT NULL AND prescription != ''")
+    moved = []
+    for (old_path,) in c.fetchall():
+        path = old_path
+        if "prescriptions" in path:
+            path = old_path.replace("prescriptions", "static")
+            if os.path.exists(old_path):
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    try:
+                        os.link(old_path, path)
+                    except OSError:
+                        shutil.copy2(old_path, path)
+                moved.append(old_path)
+        sha256 = size = None
+        if os.path.exists(path):
+            sha256 = prescriptions.hash_file(path)
+            size = os.path.getsize(path)
+        prescription_id = _prescription_id(c, sha256, path, os.path.basename(path), size)
+        c.execute("UPDATE sales SET prescription_id = ? WHERE prescription = ?", (prescription_id, old_path))
+
+    # Swap the text column for the id in the report's covering index
+    c.execute("DROP INDEX IF EXISTS idx_sales_date")
+    c.execute("ALTER TABLE sales DROP COLUMN prescription")
+    c.execute('''CREATE INDEX idx_sales_date
+                 ON sales(date, customer_id, medicine_id, quantity, total, prescription_id)''')
+
+    def remove_originals():
+        for old_path in moved:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    return remove_originals
+
+
+def _create_alert_tables(c):
+    # Optional per-category or per-medicine overrides of the default alert
+    # thresholds; a NULL threshold falls through to the next level
+    c.execute('''CREATE TABLE IF NOT EXISTS alert_thresholds (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    category TEXT UNIQUE,
+                    medicine_id INTEGER UNIQUE REFERENCES medicines(id),
+                    low_stock INTEGER,
+                    expiry_days INTEGER,
+                    CHECK ((category IS NULL) != (medicine_id IS NULL))
+                )''')
+    # Precomputed alerts, kept current by the write functions and refreshed in
+    # full by the background evaluator
+    c.execute('''CREATE TABLE IF NOT EXISTS alerts (
+                    medicine_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    raised_at TEXT NOT NULL,
+                    PRIMARY KEY (medicine_id, kind)
+                ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_kind ON alerts(kind, medicine_id)")
+    # Range scans for the default thresholds and per-category overrides
+    c.execute("CREATE INDEX IF NOT EXISTS idx_medicines_stock ON medicines(stock)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_medicines_category_stock ON medicines(category, stock)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_medicines_category_expiry ON medicines(category, expiry_date)")
+    _evaluate_alerts(c)
+
+
+def _create_medicine_lots(c):
+    # Stock arrives in lots with their own expiry. medicines.stock and
+    # medicines.expiry_date stay as the total and the earliest expiry of the
+    # medicine's live lots; emptied lots are deleted so the index only ever
+    # holds sellable stock.
+    c.execute('''CREATE TABLE IF NOT EXISTS medicine_lots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    medicine_id INTEGER NOT NULL REFERENCES medicines(id),
+                    lot_number TEXT,
+                    quantity INTEGER NOT NULL CHECK (quantity > 0),
+                    expiry_date TEXT NOT NULL,
+                    received_at TEXT NOT NULL
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_lots_fefo ON medicine_lots(medicine_id, expiry_date, id)")
+    # Existing stock becomes one lot per medicine
+    c.execute("""
+        INSERT INTO medicine_lots (medicine_id, quantity, expiry_date, received_at)
+        SELECT id, stock, expiry_date, datetime('now', 'localtime') FROM medicines WHERE stock > 0
+    """)
+
+
+def _create_search_indexes(c):
+    # Full-text indexes for the typeahead pickers. They are external-content
+    # tables (no second copy of the text) kept in step by triggers; prefix
+    # indexes make short "abc*" queries cheap.
+    for table, columns in [("medicines", ("name", "category")), ("customers", ("name", "contact"))]:
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{col}" for col in columns)
+        old = ", ".join(f"old.{col}" for col in columns)
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                          {cols}, content='{table}', content_rowid='id', prefix='1 2 3')""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                          INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.id, {new});
+                      END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                          INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+                      END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {cols} ON {table} BEGIN
+                          INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+                          INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.id, {new});
+                      END""")
+        c.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def _create_inventory_changes(c):
+    # One row per medicine holding the change number of its latest insert,
+    # update or delete, so API clients can sync inventory incrementally by
+    # asking for changes after the last number they saw. Numbers only grow
+    # because writers are serialised by the write lock.
+    c.execute("""CREATE TABLE IF NOT EXISTS inventory_changes (
+                     medicine_id INTEGER PRIMARY KEY,
+                     seq INTEGER NOT NULL
+                 )""")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_changes_seq ON inventory_changes(seq)")
+    record = """INSERT OR REPLACE INTO inventory_changes (medicine_id, seq)
+                VALUES ({}.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM inventory_changes));"""
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS medicines_changes_insert AFTER INSERT ON medicines BEGIN
+                      {record.format("new")}
+                  END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS medicines_changes_update
+                  AFTER UPDATE OF name, category, sell_price, stock, expiry_date ON medicines BEGIN
+                      {record.format("new")}
+                  END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS medicines_changes_delete AFTER DELETE ON medicines BEGIN
+                      {record.format("old")}
+                  END""")
+    c.execute("INSERT OR IGNORE INTO inventory_changes (medicine_id, seq) SELECT id, id FROM medicines")
+
+
+def _create_sales_archives(c):
+    # Closed years of sales moved out to archive files by archive_sales(),
+    # one row per file with its sales count, revenue and id range
+    c.execute("""CREATE TABLE IF NOT EXISTS sales_archives (
+                     year INTEGER PRIMARY KEY,
+                     path TEXT NOT NULL,
+                     rows INTEGER NOT NULL,
+                     revenue REAL NOT NULL,
+                     first_id INTEGER NOT NULL,
+                     last_id INTEGER NOT NULL,
+                     archived_at TEXT NOT NULL
+                 )""")
+
+
+# Older sale rows (and archives) get the price they actually sold at, and the
+# medicine's buy price today as the best known cost; sales of medicines that
+# no longer exist keep an unknown cost
+BACKFILL_SALE_PRICES = """UPDATE {sales} SET unit_price = total / quantity,
+                              unit_cost = (SELECT buy_price FROM main.medicines m WHERE m.id = medicine_id)"""
+
+
+def _snapshot_sale_prices(c):
+    # Each sale line keeps its unit price and unit cost, so later price
+    # changes no longer rewrite historical profit
+    c.execute("ALTER TABLE sales ADD COLUMN unit_price REAL")
+    c.execute("ALTER TABLE sales ADD COLUMN unit_cost REAL")
+    c.execute(BACKFILL_SALE_PRICES.format(sales="sales"))
+    # Running totals over every sale ever recorded, archived years included.
+    # Its one row is written by init_db() once the archives are upgraded too.
+    c.execute("""CREATE TABLE IF NOT EXISTS sales_ledger (
+                     id INTEGER PRIMARY KEY CHECK (id = 1),
+                     lines INTEGER NOT NULL,
+                     quantity INTEGER NOT NULL,
+                     revenue_cents INTEGER NOT NULL,
+                     profit_cents INTEGER NOT NULL
+                 )""")
+
+
+def _add_prescription_images(c):
+    # Each stored image gets a processed copy and a thumbnail; processed_at is
+    # set once the pipeline has looked at it, even if the file wasn't readable
+    c.execute("ALTER TABLE prescriptions ADD COLUMN view_path TEXT")
+    c.execute("ALTER TABLE prescriptions ADD COLUMN thumbnail_path TEXT")
+    c.execute("ALTER TABLE prescriptions ADD COLUMN processed_at TEXT")
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_hot_path_indexes,
+    _create_sales_rollups,
+    _create_prescriptions_table,
+    _create_alert_tables,
+    _create_medicine_lots,
+    _create_search_indexes,
+    _create_inventory_changes,
+    _create_sales_archives,
+    _snapshot_sale_prices,
+    _add_prescription_images,
+]
+
+
+# Bring a database up to the latest schema version. The version is re-read
+# under the write lock so concurrent processes never apply a step twice.
+# A step may return a function to run once its transaction has committed,
+# for file changes that must not happen unless the step sticks.
+def migrate(conn):
+    c = conn.cursor()
+    while True:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("PRAGMA user_version")
+            version = c.fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                return version
+            after_commit = MIGRATIONS[version](c)
+            c.execute(f"PRAGMA user_version = {version + 1}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        if after_commit:
+            after_commit()
+
+
+# Return this thread's long-lived connection, taking one from the pool if needed
 def connect_db():
-    return sqlite3.connect('pharmacy.db')
+    lease = getattr(_local, 'lease', None)
+    if lease is None or lease.generation != _generation:
+        lease = _local.lease = _acquire()
+    return lease.conn
+
+
+# Database file whose schema this process has already brought up to date
+_initialised_path = None
+_init_lock = threading.Lock()
+
+
+# Create or upgrade the schema of the configured database. Cheap after the
+# first call in a process, so entry points can call it unconditionally.
+def init_db():
+    global _initialised_path
+    with _init_lock:
+        if _initialised_path != DB_PATH:
+            conn = connect_db()
+            migrate(conn)
+            if conn.execute("SELECT 1 FROM sales_ledger").fetchone() is None:
+                _upgrade_archives(conn)
+                rebuild_ledger()
+            _initialised_path = DB_PATH
+
+
+# Point the data layer at another database file and migrate its schema.
+# Pooled connections to the old file are closed as they are returned.
+def configure_db(path):
+    global DB_PATH, _generation
+    with _config_lock:
+        DB_PATH = path
+        _generation += 1
+        while True:
+            try:
+                conn, _ = _pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    init_db()
+
+
+# Run a block of statements as one IMMEDIATE transaction on this thread's
+# connection: committed on success, rolled back if anything raises
+@contextmanager
+def transaction():
+    conn = connect_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+# ─── GROUP COMMIT WRITER ───────────────────────────────────────────────────────
+# Everyday writes (sales, stock changes, customer and medicine edits) are handed
+# to one writer thread as (body, args) requests. The writer runs everything
+# queued while its previous group was committing, up to GROUP_COMMIT_MAX
+# requests, in a single transaction, so concurrent sessions share one commit
+# instead of queueing on the write lock one commit each. GROUP_COMMIT_WINDOW
+# adds a wait for stragglers; that delays every write, so it only pays off when
+# commits are slow (e.g. synchronous=FULL). Each request runs under its own
+# savepoint: a failing request is undone alone and the rest of its group still
+# commits. Callers get a Future that resolves once the group has committed.
+# With PHARMACY_GROUP_COMMIT=0 each request commits on the caller's thread.
+
+GROUP_COMMIT = os.environ.get('PHARMACY_GROUP_COMMIT', '1') != '0'
+GROUP_COMMIT_WINDOW = float(os.environ.get('PHARMACY_GROUP_COMMIT_MS', 0)) / 1000
+GROUP_COMMIT_MAX = 256
+
+_write_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# Raised by a write body to undo its own changes and still hand `value` back
+class _Rollback(Exception):
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+
+# Run one request under a savepoint. Returns (error, value, changed): changed
+# is False when the request's changes were rolled back.
+def _run_write(c, body, args):
+    c.execute("SAVEPOINT write_request")
+    try:
+        value = body(c, *args)
+    except Exception as e:
+        c.execute("ROLLBACK TO write_request")
+        c.execute("RELEASE write_request")
+        if isinstance(e, _Rollback):
+            return None, e.value, False
+        return e, None, False
+    c.execute("RELEASE write_request")
+    return None, value, True
+
+
+# Run a group of (body, args, catalog, future) requests in one transaction on
+# this thread's connection, then mark the catalog rows they changed and resolve
+# their futures. If the transaction itself fails every future gets the error.
+def _commit_group(group):
+    group = [request for request in group if request[3].set_running_or_notify_cancel()]
+    if not group:
+        return
+    conn = connect_db()
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        outcomes = [_run_write(c, body, args) for body, args, _, _ in group]
+        conn.commit()
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        for request in group:
+            request[3].set_exception(e)
+        return
+
+    # Catalog first, so a caller woken by its future already sees its change
+    for (_, _, catalog, _), (_, value, changed) in zip(group, outcomes):
+        if catalog is not None and changed:
+            table, ids = catalog
+            _invalidate_catalog(table, ids(value) if callable(ids) else ids)
+    for (_, _, _, future), (error, value, _) in zip(group, outcomes):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+
+def _run_writer():
+    while True:
+        group = [_write_queue.get()]
+        deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+        while len(group) < GROUP_COMMIT_MAX:
+            try:
+                group.append(_write_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        _commit_group(group)
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run_writer, name="db-writer", daemon=True)
+            _writer.start()
+
+
+# Run a write body with its queries added to the capture of the thread that
+# submitted it, so a rerun's profile includes the writes it waited for
+def _captured(body, queries):
+    def run(c, *args):
+        previous = getattr(_local, "queries", None)
+        _local.queries = queries
+        try:
+            return body(c, *args)
+        finally:
+            _local.queries = previous
+    return run
+
+
+# Queue `body(c, *args)` for the writer thread and return a Future for what it
+# returns. `catalog` is (table, ids) for the catalog rows the write changes;
+# ids may be a function of the result, for inserts. Bodies must not commit.
+def submit_write(body, *args, catalog=None):
+    queries = getattr(_local, "queries", None)
+    if queries is not None:
+        body = _captured(body, queries)
+    future = Future()
+    request = (body, args, catalog, future)
+    if GROUP_COMMIT:
+        _start_writer()
+        _write_queue.put(request)
+    else:
+        _commit_group([request])
+    return future
+
+
+# A read-only connection used only to watch PRAGMA data_version. SQLite bumps
+# it whenever any *other* connection commits, so keeping it separate from the
+# pool lets it see writes made by every thread of this process as well as by
+# other processes.
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+# Process-wide counter that changes after every committed write to the database
+def data_version():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None or _watcher[1] != _generation:
+            if _watcher is not None:
+                _watcher[0].close()
+            _watcher = (sqlite3.connect(DB_PATH, check_same_thread=False), _generation)
+        return (_generation, _watcher[0].execute("PRAGMA data_version").fetchone()[0])
+
+
+# Give this thread's connection back to the pool before the thread ends
+def close_db():
+    _local.__dict__.pop('lease', None)
 
 
 def fetch_medicines():
@@ -58,7 +827,6 @@ def fetch_medicines():
     c = conn.cursor()
     c.execute("SELECT * FROM medicines")
     data = c.fetchall()
-    conn.close()
     return data
 
 
@@ -67,49 +835,122 @@ def fetch_customers():
     c = conn.cursor()
     c.execute("SELECT * FROM customers")
     data = c.fetchall()
-    conn.close()
     return data
 
 
+# Every sale, archived years included
 def fetch_sales():
     conn = connect_db()
     c = conn.cursor()
-    c.execute("""
+    c.execute(f"""
         SELECT c.name AS customer_name,
                m.name AS medicine_name,
                s.quantity,
                s.total,
                s.date,
-               s.prescription
-        FROM sales s
+               p.path AS prescription
+        FROM {_sales_source(conn)} s
         JOIN customers c ON s.customer_id = c.id
         JOIN medicines m ON s.medicine_id = m.id
+        LEFT JOIN prescriptions p ON s.prescription_id = p.id
     """)
     data = c.fetchall()
-    conn.close()
     return data
 
 
+# ─── KEYSET PAGINATION ─────────────────────────────────────────────────────────
+# Pages are addressed by the id at their edge rather than an OFFSET, so every
+# page is an index seek on the primary key no matter how deep it is.
+
+def _fetch_id_page(query, limit, after_id=None, before_id=None, newest_first=False):
+    # "Forward" follows the listing order; stepping back reads the other way
+    # round and flips the rows so callers always get listing order.
+    if before_id is not None:
+        where, params, descending = "id < ?", (before_id,), True
+    elif after_id is not None:
+        where, params, descending = "id > ?", (after_id,), False
+    else:
+        where, params, descending = "1", (), newest_first
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(
+        f"{query} WHERE {where} ORDER BY id {'DESC' if descending else 'ASC'} LIMIT ?",
+        params + (limit,)
+    )
+    rows = c.fetchall()
+    if descending != newest_first:
+        rows.reverse()
+    return rows
+
+
+# Medicines in id order: the page after `after_id`, or the page before `before_id`
+def fetch_medicines_page(limit=50, after_id=None, before_id=None):
+    return _fetch_id_page("SELECT * FROM medicines", limit, after_id, before_id)
+
+
+# Customers in id order: the page after `after_id`, or the page before `before_id`
+def fetch_customers_page(limit=50, after_id=None, before_id=None):
+    return _fetch_id_page("SELECT * FROM customers", limit, after_id, before_id)
+
+
+# Medicines changed after change number `since`, oldest change first, as
+# (seq, id, name, category, sell_price, stock, expiry_date). A deleted
+# medicine comes back with None after its id. Pass the last seq seen as
+# `since` to read the next batch.
+def fetch_inventory_changes(since=0, limit=1000):
+    c = connect_db().cursor()
+    c.execute(
+        """SELECT ch.seq, ch.medicine_id, m.name, m.category, m.sell_price, m.stock, m.expiry_date
+           FROM inventory_changes ch
+           LEFT JOIN medicines m ON m.id = ch.medicine_id
+           WHERE ch.seq > ?
+           ORDER BY ch.seq
+           LIMIT ?""",
+        (since, limit)
+    )
+    return c.fetchall()
+
+
+# Newest sales first: sales older than `before_id`, or newer than `after_id`.
+# Rows are (id, customer, medicine, quantity, total, date, prescription).
+# Archived years are not paged into.
+def fetch_recent_sales(limit=5, before_id=None, after_id=None):
+    query = """
+        SELECT * FROM (
+            SELECT s.id,
+                   c.name AS customer_name,
+                   m.name AS medicine_name,
+                   s.quantity,
+                   s.total,
+                   s.date,
+                   p.path AS prescription
+            FROM sales s
+            JOIN customers c ON s.customer_id = c.id
+            JOIN medicines m ON s.medicine_id = m.id
+            LEFT JOIN prescriptions p ON s.prescription_id = p.id
+        )"""
+    return _fetch_id_page(query, limit, after_id, before_id, newest_first=True)
+
+
+# Revenue of every sale ever recorded, read from the sales ledger
 def calculate_total_sales():
     conn = connect_db()
     c = conn.cursor()
-    c.execute("SELECT SUM(total) FROM sales")
-    total = c.fetchone()[0] or 0
-    conn.close()
-    return total
+    c.execute("SELECT revenue_cents FROM sales_ledger")
+    row = c.fetchone()
+    return row[0] / 100 if row else 0
 
 
+# Profit at the prices each sale was made at, read from the sales ledger
 def calculate_total_profit():
     conn = connect_db()
     c = conn.cursor()
-    c.execute("""
-        SELECT SUM(s.quantity * (m.sell_price - m.buy_price))
-        FROM sales s
-        JOIN medicines m ON s.medicine_id = m.id
-    """)
-    profit = c.fetchone()[0] or 0
-    conn.close()
-    return profit
+    c.execute("SELECT profit_cents FROM sales_ledger")
+    row = c.fetchone()
+    return row[0] / 100 if row else 0
+
+
+EXPIRING_QUERY = "SELECT COUNT(*) FROM medicines WHERE expiry_date <= ? AND expiry_date >= ?"
 
 
 def medicines_expiring_this_week():
@@ -117,123 +958,1071 @@ def medicines_expiring_this_week():
     c = conn.cursor()
     today = datetime.now()
     end_of_week = (today + timedelta(days=7)).strftime('%Y-%m-%d')
-    c.execute(
-        "SELECT COUNT(*) FROM medicines WHERE expiry_date <= ? AND expiry_date >= ?",
-        (end_of_week, today.strftime('%Y-%m-%d'))
-    )
+    c.execute(EXPIRING_QUERY, (end_of_week, today.strftime('%Y-%m-%d')))
     count = c.fetchone()[0] or 0
-    conn.close()
     return count
 
 
-def add_medicine(name, category, buy_price, sell_price, stock, expiry_date):
+_summary_cache = {}
+_summary_lock = threading.Lock()
+
+
+# All Dashboard metrics in one query round-trip, cached across sessions until
+# the database changes (the alert evaluator rewrites alerts when the day rolls over)
+def dashboard_summary():
+    key = data_version()
+    with _summary_lock:
+        if key in _summary_cache:
+            return _summary_cache[key]
+
     conn = connect_db()
     c = conn.cursor()
+    c.execute("""
+        SELECT (SELECT COUNT(*) FROM medicines),
+               (SELECT COUNT(*) FROM customers),
+               (SELECT COALESCE(SUM(lines), 0) FROM sales_ledger),
+               (SELECT COUNT(*) FROM prescriptions),
+               (SELECT COALESCE(SUM(revenue_cents), 0) / 100.0 FROM sales_ledger),
+               (SELECT COALESCE(SUM(profit_cents), 0) / 100.0 FROM sales_ledger),
+               (SELECT COUNT(*) FROM alerts WHERE kind = 'expiring')
+    """)
+    row = c.fetchone()
+    summary = dict(zip(
+        ["medicines", "customers", "transactions", "prescriptions",
+         "total_sales", "total_profit", "expiring_soon"],
+        row
+    ))
+
+    with _summary_lock:
+        _summary_cache.clear()
+        _summary_cache[key] = summary
+    return summary
+
+
+# ─── REFERENCE DATA CATALOG ────────────────────────────────────────────────────
+# Id → name/price/stock lookups for medicines and customers, built once and
+# shared by every session. The write functions below mark the rows they change
+# and those rows alone are re-read on the next lookup, so keeping the catalog
+# current costs the same whatever its size. Bulk writes rebuild it, and writes
+# made by other processes (manage.py, a second server) show up once it is
+# CATALOG_MAX_AGE seconds old.
+
+CATALOG_MAX_AGE = 60
+
+MedicineCatalog = collections.namedtuple("MedicineCatalog", "names prices stock")
+CustomerCatalog = collections.namedtuple("CustomerCatalog", "names")
+
+# table -> (query selecting id then one column per catalog field, catalog type)
+_CATALOG_QUERIES = {
+    "medicines": ("SELECT id, name, sell_price, stock FROM medicines", MedicineCatalog),
+    "customers": ("SELECT id, name FROM customers", CustomerCatalog),
+}
+
+_catalog = {}            # table -> (built_at, catalog)
+_catalog_versions = {}   # table -> invalidation count
+_catalog_dirty = {}      # table -> ids changed since the catalog was built
+_catalog_lock = threading.Lock()
+
+
+# Mark rows of `table` as changed, or the whole table when `ids` is None
+def _invalidate_catalog(table, ids=None):
+    with _catalog_lock:
+        _catalog_versions[table] = _catalog_versions.get(table, 0) + 1
+        if ids is None:
+            _catalog.pop(table, None)
+        else:
+            _catalog_dirty.setdefault(table, set()).update(ids)
+
+
+def _build_catalog(table):
+    query, kind = _CATALOG_QUERIES[table]
+    c = connect_db().cursor()
+    c.execute(query)
+    rows = c.fetchall()
+    return kind(*({row[0]: row[i] for row in rows} for i in range(1, len(kind._fields) + 1)))
+
+
+# Re-read the changed rows into the cached catalog; rows that no longer exist
+# are dropped. Called with _catalog_lock held so patches apply in order.
+def _patch_catalog(table, catalog, ids):
+    query, _ = _CATALOG_QUERIES[table]
+    ids = list(ids)
+    c = connect_db().cursor()
+    c.execute(f"{query} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+    rows = c.fetchall()
+    for lookup in catalog:
+        for row_id in ids:
+            lookup.pop(row_id, None)
+    for row in rows:
+        for i, lookup in enumerate(catalog, 1):
+            lookup[row[0]] = row[i]
+
+
+# Return the cached catalog for `table`, patching changed rows or rebuilding it
+# if it was dropped or is too old. A rebuild that overlaps a write is returned
+# to its caller but not cached, so a stale catalog is never stored.
+def _cached_catalog(table):
+    with _catalog_lock:
+        entry = _catalog.get(table)
+        if entry is not None and time.monotonic() - entry[0] < CATALOG_MAX_AGE:
+            dirty = _catalog_dirty.pop(table, None)
+            if dirty:
+                _patch_catalog(table, entry[1], dirty)
+            return entry[1]
+        version = _catalog_versions.get(table, 0)
+    built_at = time.monotonic()
+    catalog = _build_catalog(table)
+    with _catalog_lock:
+        if _catalog_versions.get(table, 0) == version:
+            _catalog[table] = (built_at, catalog)
+            _catalog_dirty.pop(table, None)
+    return catalog
+
+
+# Shared medicine lookups; treat the returned dicts as read-only
+def medicine_catalog():
+    return _cached_catalog("medicines")
+
+
+# Shared customer lookups; treat the returned dicts as read-only
+def customer_catalog():
+    return _cached_catalog("customers")
+
+
+# ─── TYPEAHEAD SEARCH ──────────────────────────────────────────────────────────
+# Prefix search over the FTS5 indexes: "para 500" finds rows with a word
+# starting "para" and one starting "500". Rows matching on name come before
+# rows matching only on another column; within those, names that start with
+# what was typed come first, then shorter names. At most SEARCH_CANDIDATES
+# matches of each kind are ordered, so a one-letter query costs about the
+# same as a long one.
+
+SEARCH_CANDIDATES = 1000
+
+
+# Rows of `select` matching every word of `query` as a prefix in any indexed
+# column. With no query, the first rows by id.
+def _search(table, select, query, limit):
+    c = connect_db().cursor()
+    words = re.findall(r"\w+", query or "")[:8]
+    if not words:
+        c.execute(f"SELECT {select} FROM {table} t ORDER BY t.id LIMIT ?", (limit,))
+        return c.fetchall()
+    match = " ".join(f'"{word}"*' for word in words)
+    starts_with = " ".join(words).replace("_", "\\_") + "%"
+    c.execute(
+        f"""SELECT {select}
+            FROM (SELECT rowid, MIN(on_name) AS on_name FROM (
+                      SELECT * FROM (SELECT rowid, 0 AS on_name FROM {table}_fts
+                                     WHERE {table}_fts MATCH ? LIMIT ?)
+                      UNION ALL
+                      SELECT * FROM (SELECT rowid, 1 AS on_name FROM {table}_fts
+                                     WHERE {table}_fts MATCH ? LIMIT ?)
+                  ) GROUP BY rowid) f
+            JOIN {table} t ON t.id = f.rowid
+            ORDER BY f.on_name, t.name LIKE ? ESCAPE '\\' DESC, length(t.name), t.name
+            LIMIT ?""",
+        (f"name : ({match})", SEARCH_CANDIDATES, match, SEARCH_CANDIDATES, starts_with, limit)
+    )
+    return c.fetchall()
+
+
+# Top matches on medicine name or category: [(id, name, category, sell_price, stock), ...]
+def search_medicines(query, limit=20):
+    return _search("medicines", "t.id, t.name, t.category, t.sell_price, t.stock", query, limit)
+
+
+# Top matches on customer name or contact: [(id, name, contact), ...]
+def search_customers(query, limit=20):
+    return _search("customers", "t.id, t.name, t.contact", query, limit)
+
+
+def _insert_medicine(c, name, category, buy_price, sell_price, stock, expiry_date):
     c.execute(
         "INSERT INTO medicines (name, category, buy_price, sell_price, stock, expiry_date) VALUES (?, ?, ?, ?, ?, ?)",
         (name, category, buy_price, sell_price, stock, expiry_date)
     )
-    conn.commit()
-    conn.close()
+    medicine_id = c.lastrowid
+    _replace_lots(c, medicine_id, stock, expiry_date)
+    _evaluate_alerts(c, [medicine_id])
+    return medicine_id
 
 
-def add_customer(name, contact, address):
-    conn = connect_db()
-    c = conn.cursor()
+# Add one medicine through the writer queue; returns its id
+def add_medicine(name, category, buy_price, sell_price, stock, expiry_date):
+    return submit_write(
+        _insert_medicine, name, category, buy_price, sell_price, stock, expiry_date,
+        catalog=("medicines", lambda medicine_id: [medicine_id])
+    ).result()
+
+
+# Yield lists of up to `size` items from any iterable
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Insert many (name, category, buy_price, sell_price, stock, expiry_date) rows
+# in one transaction with batched executemany; returns the number inserted
+def add_medicines_bulk(rows, batch_size=10000):
+    count = 0
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM medicines")
+        last_id = c.fetchone()[0]
+        for batch in _batches(rows, batch_size):
+            c.executemany(
+                "INSERT INTO medicines (name, category, buy_price, sell_price, stock, expiry_date) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            count += len(batch)
+        # Opening stock of every new medicine becomes its first lot
+        c.execute("""
+            INSERT INTO medicine_lots (medicine_id, quantity, expiry_date, received_at)
+            SELECT id, stock, expiry_date, datetime('now', 'localtime') FROM medicines
+            WHERE id > ? AND stock > 0
+        """, (last_id,))
+        if count:
+            _evaluate_alerts(c)
+    _invalidate_catalog("medicines")
+    return count
+
+
+# Insert many (name, contact, address) rows in one transaction with batched
+# executemany; returns the number inserted
+def add_customers_bulk(rows, batch_size=10000):
+    count = 0
+    with transaction() as conn:
+        c = conn.cursor()
+        for batch in _batches(rows, batch_size):
+            c.executemany("INSERT INTO customers (name, contact, address) VALUES (?, ?, ?)", batch)
+            count += len(batch)
+    _invalidate_catalog("customers")
+    return count
+
+
+def _insert_customer(c, name, contact, address):
     c.execute(
         "INSERT INTO customers (name, contact, address) VALUES (?, ?, ?)",
         (name, contact, address)
     )
-    conn.commit()
-    conn.close()
+    return c.lastrowid
 
 
-def record_sale(customer_id, medicine_id, quantity, prescription_path=None):
-    conn = connect_db()
-    c = conn.cursor()
+# Queue a new customer; the Future resolves to its id once committed
+def add_customer_async(name, contact, address):
+    return submit_write(
+        _insert_customer, name, contact, address,
+        catalog=("customers", lambda customer_id: [customer_id])
+    )
 
-    # Check medicine stock and price
-    c.execute("SELECT sell_price, stock FROM medicines WHERE id = ?", (medicine_id,))
-    medicine = c.fetchone()
 
-    if not medicine:
-        conn.close()
-        return "Medicine not found."
+def add_customer(name, contact, address):
+    return add_customer_async(name, contact, address).result()
 
-    price, stock = medicine
-    if stock < quantity:
-        conn.close()
-        return "Not enough stock available."
 
-    total = price * quantity
-    new_stock = stock - quantity
+def _record_prescription_images(c, results):
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    c.executemany(
+        "UPDATE prescriptions SET view_path = ?, thumbnail_path = ?, processed_at = ? WHERE id = ?",
+        [(view_path, thumbnail_path, now, prescription_id)
+         for prescription_id, view_path, thumbnail_path in results]
+    )
+
+
+# Hand one stored image to the worker processes and record the result when
+# it comes back. Nothing here waits for the image.
+def _process_prescription(prescription_id, path, sha256):
+    def done(future):
+        try:
+            view_path, thumbnail_path = future.result()
+        except Exception as e:
+            prescription_logger.warning("Could not process prescription %s (%s): %s", prescription_id, path, e)
+            view_path = thumbnail_path = None
+        submit_write(_record_prescription_images, [(prescription_id, view_path, thumbnail_path)])
+
+    prescriptions.process_async(path, *prescriptions.derived_paths(sha256)).add_done_callback(done)
+
+
+# Process stored prescription images in a batch: those not processed yet, or
+# every image with `everything`. Results are committed `chunk_size` at a time
+# and progress(done, failed) is called after each commit. Returns
+# (processed, failed, seconds).
+def process_prescriptions(everything=False, workers=None, chunk_size=200, progress=None):
+    c = connect_db().cursor()
+    c.execute("SELECT id, path, sha256 FROM prescriptions WHERE sha256 IS NOT NULL"
+              + ("" if everything else " AND processed_at IS NULL") + " ORDER BY id")
+    jobs, ids = [], {}
+    for prescription_id, path, sha256 in c.fetchall():
+        if prescriptions.is_image(path) and os.path.exists(path):
+            job = (path, *prescriptions.derived_paths(sha256))
+            ids[job] = prescription_id
+            jobs.append(job)
+
+    start = time.perf_counter()
+    processed = failed = 0
+    results = []
+    for job, result, error in prescriptions.process_batch(jobs, workers):
+        if error:
+            prescription_logger.warning("Could not process prescription %s (%s): %s", ids[job], job[0], error)
+            failed += 1
+        else:
+            processed += 1
+        results.append((ids[job], *(result or (None, None))))
+        if len(results) >= chunk_size:
+            submit_write(_record_prescription_images, results).result()
+            results = []
+            if progress:
+                progress(processed, failed)
+    if results:
+        submit_write(_record_prescription_images, results).result()
+        if progress:
+            progress(processed, failed)
+    return processed, failed, time.perf_counter() - start
 
-    # Update stock and record the sale with prescription path
-    c.execute("UPDATE medicines SET stock = ? WHERE id = ?", (new_stock, medicine_id))
-    date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+# {path: (view_path, thumbnail_path)} for the processed images among `paths`
+def fetch_prescription_images(paths):
+    paths = [path for path in set(paths) if path]
+    if not paths:
+        return {}
+    c = connect_db().cursor()
     c.execute(
-        "INSERT INTO sales (customer_id, medicine_id, quantity, total, date, prescription) VALUES (?, ?, ?, ?, ?, ?)",
-        (customer_id, medicine_id, quantity, total, date, prescription_path)
+        f"""SELECT path, view_path, thumbnail_path FROM prescriptions
+            WHERE thumbnail_path IS NOT NULL AND path IN ({', '.join('?' * len(paths))})""",
+        paths
     )
+    return {path: (view_path, thumbnail_path) for path, view_path, thumbnail_path in c.fetchall()}
 
-    conn.commit()
-    conn.close()
-    return "Sale recorded successfully!"
 
+def record_sale(customer_id, medicine_id, quantity, prescription_id=None):
+    _, results = record_sales_batch(customer_id, [(medicine_id, quantity)], prescription_id)
+    return results[0]
 
-def generate_report(start_date, end_date):
+
+def _sell(c, customer_id, lines, prescription_id):
+    now = datetime.now()
+    date = now.strftime('%Y-%m-%d %H:%M:%S')
+    today = now.strftime('%Y-%m-%d')
+    results = []
+    rows = []
+    failed = False
+
+    for medicine_id, quantity in lines:
+        if not _allocate_fefo(c, medicine_id, quantity, today):
+            c.execute("SELECT 1 FROM medicines WHERE id = ?", (medicine_id,))
+            results.append("Not enough stock available." if c.fetchone() else "Medicine not found.")
+            failed = True
+            continue
+        c.execute(
+            """UPDATE medicines
+               SET stock = stock - ?,
+                   expiry_date = COALESCE(
+                       (SELECT MIN(expiry_date) FROM medicine_lots WHERE medicine_id = ?), expiry_date)
+               WHERE id = ? AND stock >= ?
+               RETURNING sell_price, buy_price""",
+            (quantity, medicine_id, medicine_id, quantity)
+        )
+        updated = c.fetchone()
+        if updated is None:
+            results.append("Not enough stock available.")
+            failed = True
+            continue
+        price, cost = updated
+        rows.append((customer_id, medicine_id, quantity, price * quantity, date, prescription_id, price, cost))
+        results.append("Sale recorded successfully!")
+
+    if failed:
+        results = [
+            "Sale cancelled: another item in this sale could not be sold." if msg == "Sale recorded successfully!" else msg
+            for msg in results
+        ]
+        raise _Rollback((False, results))
+
+    c.executemany(
+        """INSERT INTO sales (customer_id, medicine_id, quantity, total, date, prescription_id, unit_price, unit_cost)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+    _add_to_rollups(c, rows)
+    _add_to_ledger(c, [(quantity, total, cost) for _, _, quantity, total, _, _, _, cost in rows])
+    _evaluate_alerts(c, [medicine_id for medicine_id, _ in lines])
+    return True, results
+
+
+# Sell several cart lines in one transaction. Each line is (medicine_id, quantity).
+# Every line is filled from the medicine's lots first-expired-first-out, skipping
+# expired lots; if any line fails the whole sale is rolled back.
+# The Future resolves to (success, [message per line]).
+def record_sales_batch_async(customer_id, lines, prescription_id=None):
+    lines = list(lines)
+    return submit_write(
+        _sell, customer_id, lines, prescription_id,
+        catalog=("medicines", [medicine_id for medicine_id, _ in lines])
+    )
+
+
+def record_sales_batch(customer_id, lines, prescription_id=None):
+    return record_sales_batch_async(customer_id, lines, prescription_id).result()
+
+
+def _sell_with_prescription(c, customer_id, lines, stored):
+    return _sell(c, customer_id, lines, _prescription_id(c, *stored))
+
+
+# Sell a cart with an uploaded prescription (any file-like object). The file
+# is saved first and its row added in the same write as the sale, so a cart
+# that is refused leaves no prescription behind. Identical files share one
+# copy on disk and one row. Images are processed in the background; until
+# then the row has no thumbnail.
+def record_sales_with_prescription(customer_id, lines, upload, original_name):
+    sha256, path, size = prescriptions.save_upload(upload, original_name)
+    lines = list(lines)
+    ok, results = submit_write(
+        _sell_with_prescription, customer_id, lines, (sha256, path, original_name, size),
+        catalog=("medicines", [medicine_id for medicine_id, _ in lines])
+    ).result()
+    if ok:
+        c = connect_db().cursor()
+        c.execute("SELECT id, path, processed_at FROM prescriptions WHERE sha256 = ?", (sha256,))
+        prescription_id, stored_path, processed_at = c.fetchone()
+        if processed_at is None and prescriptions.is_image(stored_path):
+            _process_prescription(prescription_id, stored_path, sha256)
+    return ok, results
+
+
+# ─── MEDICINE LOTS ─────────────────────────────────────────────────────────────
+
+FEFO_QUERY = """SELECT id, quantity FROM medicine_lots
+                WHERE medicine_id = ? AND expiry_date >= ?
+                ORDER BY expiry_date, id"""
+
+
+SELLABLE_QUERY = """SELECT COALESCE(SUM(quantity), 0) FROM medicine_lots
+                   WHERE medicine_id = ? AND expiry_date >= ?"""
+
+
+# Units of a medicine that can be sold today: its stock less expired lots,
+# which stay counted in medicines.stock until they are written off
+def sellable_stock(medicine_id):
+    c = connect_db().cursor()
+    c.execute(SELLABLE_QUERY, (medicine_id, datetime.now().strftime('%Y-%m-%d')))
+    return c.fetchone()[0]
+
+
+# Take `quantity` units from the medicine's unexpired lots, earliest expiry
+# first. The index on (medicine_id, expiry_date) is read only as far as the
+# lots needed, so the cost is one seek plus the lots actually consumed.
+# Returns False (changing nothing) if there is not enough unexpired stock.
+def _allocate_fefo(c, medicine_id, quantity, today):
+    lots = c.connection.execute(FEFO_QUERY, (medicine_id, today))
+    taken = []
+    remaining = quantity
+    for lot_id, lot_quantity in lots:
+        take = min(remaining, lot_quantity)
+        taken.append((lot_id, lot_quantity - take))
+        remaining -= take
+        if remaining == 0:
+            break
+    lots.close()
+    if remaining > 0:
+        return False
+
+    c.executemany("DELETE FROM medicine_lots WHERE id = ?", [(lot_id,) for lot_id, left in taken if left == 0])
+    c.executemany("UPDATE medicine_lots SET quantity = ? WHERE id = ?", [(left, lot_id) for lot_id, left in taken if left > 0])
+    return True
+
+
+# Recompute a medicine's total stock and earliest expiry from its lots
+def _sync_medicine_stock(c, medicine_id):
+    c.execute(
+        """UPDATE medicines
+           SET stock = (SELECT COALESCE(SUM(quantity), 0) FROM medicine_lots WHERE medicine_id = ?),
+               expiry_date = COALESCE(
+                   (SELECT MIN(expiry_date) FROM medicine_lots WHERE medicine_id = ?), expiry_date)
+           WHERE id = ?""",
+        (medicine_id, medicine_id, medicine_id)
+    )
+
+
+def _replace_lots(c, medicine_id, stock, expiry_date):
+    c.execute("DELETE FROM medicine_lots WHERE medicine_id = ?", (medicine_id,))
+    if stock > 0:
+        c.execute(
+            "INSERT INTO medicine_lots (medicine_id, quantity, expiry_date, received_at) VALUES (?, ?, ?, ?)",
+            (medicine_id, stock, expiry_date, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+
+
+def _insert_lot(c, medicine_id, quantity, expiry_date, lot_number):
+    c.execute(
+        "INSERT INTO medicine_lots (medicine_id, lot_number, quantity, expiry_date, received_at) VALUES (?, ?, ?, ?, ?)",
+        (medicine_id, lot_number, quantity, expiry_date, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    _sync_medicine_stock(c, medicine_id)
+    _evaluate_alerts(c, [medicine_id])
+
+
+# Queue receipt of a new lot of an existing medicine; the Future resolves
+# once it is committed
+def add_lot_async(medicine_id, quantity, expiry_date, lot_number=None):
+    return submit_write(
+        _insert_lot, medicine_id, quantity, expiry_date, lot_number,
+        catalog=("medicines", [medicine_id])
+    )
+
+
+# Receive a new lot of an existing medicine
+def add_lot(medicine_id, quantity, expiry_date, lot_number=None):
+    add_lot_async(medicine_id, quantity, expiry_date, lot_number).result()
+
+
+# Live lots of one medicine in the order they will be sold
+def fetch_lots(medicine_id):
     conn = connect_db()
-    query = """
+    c = conn.cursor()
+    c.execute(
+        """SELECT id, lot_number, quantity, expiry_date, received_at FROM medicine_lots
+           WHERE medicine_id = ? ORDER BY expiry_date, id""",
+        (medicine_id,)
+    )
+    return c.fetchall()
+
+
+# ─── DAILY SALES ROLLUPS ───────────────────────────────────────────────────────
+
+# Fold freshly inserted sale rows into the daily rollups (same transaction)
+def _add_to_rollups(c, rows):
+    c.executemany(
+        """INSERT INTO sales_daily_medicine (day, medicine_id, quantity, revenue) VALUES (?, ?, ?, ?)
+           ON CONFLICT (day, medicine_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity,
+               revenue = revenue + excluded.revenue""",
+        [(date[:10], medicine_id, quantity, total) for _, medicine_id, quantity, total, date, *_ in rows]
+    )
+    c.executemany(
+        """INSERT INTO sales_daily_customer (day, customer_id, quantity, revenue) VALUES (?, ?, ?, ?)
+           ON CONFLICT (day, customer_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity,
+               revenue = revenue + excluded.revenue""",
+        [(date[:10], customer_id, quantity, total) for customer_id, _, quantity, total, date, *_ in rows]
+    )
+
+
+# Recompute the rollups from the sales table and the archives, e.g. after
+# editing sales by hand
+def rebuild_rollups():
+    source = _sales_source(connect_db())
+    with transaction() as conn:
+        _rebuild_rollups(conn.cursor(), source)
+
+
+REPORT_QUERY = """
     SELECT s.date,
            c.name as Customer,
            m.name as Medicine,
            s.quantity,
            s.total,
-           s.prescription
-    FROM sales s
+           p.path AS prescription
+    FROM {sales} s
     JOIN customers c ON s.customer_id = c.id
     JOIN medicines m ON s.medicine_id = m.id
+    LEFT JOIN prescriptions p ON s.prescription_id = p.id
     WHERE s.date BETWEEN ? AND ?
     """
+
+REPORT_COLUMNS = ["date", "Customer", "Medicine", "quantity", "total", "prescription"]
+
+
+def generate_report(start_date, end_date):
+    import pandas as pd
+
+    conn = connect_db()
+    query = REPORT_QUERY.format(sales=_sales_source(conn, start_date, end_date))
     df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-    conn.close()
     return df
 
 
-def delete_medicine(medicine_id):
+# Same rows as generate_report, yielded in lists of at most `chunk_size` rows
+# straight off the cursor so memory stays flat however long the range is
+def iter_report(start_date, end_date, chunk_size=5000):
     conn = connect_db()
     c = conn.cursor()
+    c.execute(REPORT_QUERY.format(sales=_sales_source(conn, start_date, end_date)), (start_date, end_date))
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        c.close()
+
+
+def _delete_medicine(c, medicine_id):
     c.execute("DELETE FROM medicines WHERE id = ?", (medicine_id,))
-    conn.commit()
-    conn.close()
+    c.execute("DELETE FROM medicine_lots WHERE medicine_id = ?", (medicine_id,))
+    c.execute("DELETE FROM alert_thresholds WHERE medicine_id = ?", (medicine_id,))
+    _evaluate_alerts(c, [medicine_id])
 
 
-def delete_customer(customer_id):
-    conn = connect_db()
-    c = conn.cursor()
+def delete_medicine(medicine_id):
+    submit_write(_delete_medicine, medicine_id, catalog=("medicines", [medicine_id])).result()
+
+
+def _delete_customer(c, customer_id):
     c.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
-    conn.commit()
-    conn.close()
 
 
-def update_medicine(medicine_id, name, category, buy_price, sell_price, stock, expiry_date):
-    conn = connect_db()
-    c = conn.cursor()
+def delete_customer(customer_id):
+    submit_write(_delete_customer, customer_id, catalog=("customers", [customer_id])).result()
+
+
+def _update_medicine(c, medicine_id, name, category, buy_price, sell_price, stock, expiry_date):
     c.execute(
         "UPDATE medicines SET name = ?, category = ?, buy_price = ?, sell_price = ?, expiry_date = ?, stock = ? WHERE id = ?",
         (name, category, buy_price, sell_price, expiry_date, stock, medicine_id)
     )
-    conn.commit()
-    conn.close()
+    # Setting stock and expiry directly replaces the medicine's lots with one
+    _replace_lots(c, medicine_id, stock, expiry_date)
+    _evaluate_alerts(c, [medicine_id])
+
+
+def update_medicine(medicine_id, name, category, buy_price, sell_price, stock, expiry_date):
+    submit_write(
+        _update_medicine, medicine_id, name, category, buy_price, sell_price, stock, expiry_date,
+        catalog=("medicines", [medicine_id])
+    ).result()
+
+
+def _update_customer(c, customer_id, name, contact, address):
+    c.execute(
+        "UPDATE customers SET name = ?, contact = ?, address = ? WHERE id = ?",
+        (name, contact, address, customer_id)
+    )
 
 
 def update_customer(customer_id, name, contact, address):
+    submit_write(
+        _update_customer, customer_id, name, contact, address,
+        catalog=("customers", [customer_id])
+    ).result()
+
+
+# ─── STOCK AND EXPIRY ALERTS ───────────────────────────────────────────────────
+
+# Used for any medicine whose category and id have no threshold override
+DEFAULT_LOW_STOCK = 10
+DEFAULT_EXPIRY_DAYS = 7
+
+# For each alert kind: the medicines column tested and the bound it must not
+# exceed when the threshold comes from an alert_thresholds row `t`
+_ALERT_RULES = {
+    "low_stock": ("stock", "low_stock", "t.low_stock", ":low_stock"),
+    "expiry": ("expiry_date", "expiry_days",
+               "date(:today, '+' || t.expiry_days || ' days')", ":expiry_cutoff"),
+}
+
+
+# Medicines breaching one rule. Each precedence level (medicine override,
+# category override, default) is its own indexed range query on the column;
+# CROSS JOIN keeps the small thresholds table on the outside of the loop.
+def _breach_query(rule, id_filter):
+    column, setting, override_bound, default_bound = _ALERT_RULES[rule]
+    medicine_overrides = f"SELECT medicine_id FROM alert_thresholds WHERE medicine_id IS NOT NULL AND {setting} IS NOT NULL"
+    category_overrides = f"SELECT category FROM alert_thresholds WHERE category IS NOT NULL AND {setting} IS NOT NULL"
+    return f"""
+        SELECT m.id, m.expiry_date FROM alert_thresholds t
+        JOIN medicines m ON m.id = t.medicine_id
+        WHERE t.{setting} IS NOT NULL AND m.{column} <= {override_bound} {id_filter}
+        UNION ALL
+        SELECT m.id, m.expiry_date FROM alert_thresholds t
+        CROSS JOIN medicines m ON m.category = t.category AND m.{column} <= {override_bound}
+        WHERE t.category IS NOT NULL AND t.{setting} IS NOT NULL
+          AND m.id NOT IN ({medicine_overrides}) {id_filter}
+        UNION ALL
+        SELECT m.id, m.expiry_date FROM medicines m
+        WHERE m.{column} <= {default_bound}
+          AND m.category NOT IN ({category_overrides})
+          AND m.id NOT IN ({medicine_overrides}) {id_filter}
+    """
+
+
+# Recompute alerts for the given medicine ids, or for every medicine when
+# `medicine_ids` is None. Runs on the caller's cursor and transaction.
+def _evaluate_alerts(c, medicine_ids=None):
+    now = datetime.now()
+    params = {
+        "today": now.strftime('%Y-%m-%d'),
+        "now": now.strftime('%Y-%m-%d %H:%M:%S'),
+        "low_stock": DEFAULT_LOW_STOCK,
+        "expiry_cutoff": (now + timedelta(days=DEFAULT_EXPIRY_DAYS)).strftime('%Y-%m-%d'),
+    }
+    if medicine_ids is None:
+        id_filter = ""
+        c.execute("DELETE FROM alerts")
+    else:
+        ids = {f"id{i}": medicine_id for i, medicine_id in enumerate(set(medicine_ids))}
+        if not ids:
+            return
+        params.update(ids)
+        placeholders = ", ".join(f":{name}" for name in ids)
+        id_filter = f"AND m.id IN ({placeholders})"
+        c.execute(f"DELETE FROM alerts WHERE medicine_id IN ({placeholders})", ids)
+
+    c.execute(
+        f"INSERT OR IGNORE INTO alerts (medicine_id, kind, raised_at) "
+        f"SELECT id, 'low_stock', :now FROM ({_breach_query('low_stock', id_filter)})",
+        params
+    )
+    c.execute(
+        f"INSERT OR IGNORE INTO alerts (medicine_id, kind, raised_at) "
+        f"SELECT id, CASE WHEN expiry_date < :today THEN 'expired' ELSE 'expiring' END, :now "
+        f"FROM ({_breach_query('expiry', id_filter)})",
+        params
+    )
+
+
+# Recompute every alert, e.g. after thresholds change or the date rolls over
+def refresh_alerts():
+    with transaction() as conn:
+        _evaluate_alerts(conn.cursor())
+
+
+# Medicine rows with an alert of any of the given kinds
+def fetch_alerts(*kinds):
     conn = connect_db()
     c = conn.cursor()
     c.execute(
-        "UPDATE customers SET name = ?, contact = ?, address = ? WHERE id = ?",
-        (name, contact, address, customer_id)
+        f"""SELECT DISTINCT m.* FROM alerts a
+            JOIN medicines m ON m.id = a.medicine_id
+            WHERE a.kind IN ({", ".join("?" * len(kinds))})
+            ORDER BY m.id""",
+        kinds
     )
-    
-    conn.commit()
-    conn.close()
+    return c.fetchall()
+
+
+def fetch_alert_thresholds():
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT t.id, t.category, m.name, t.low_stock, t.expiry_days
+        FROM alert_thresholds t
+        LEFT JOIN medicines m ON m.id = t.medicine_id
+        ORDER BY t.category IS NULL, t.category, m.name
+    """)
+    return c.fetchall()
+
+
+# Override the thresholds for one category or one medicine (pass exactly one).
+# A None threshold keeps using the next level down for that alert.
+def set_alert_threshold(category=None, medicine_id=None, low_stock=None, expiry_days=None):
+    key = "medicine_id" if medicine_id is not None else "category"
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"""INSERT INTO alert_thresholds (category, medicine_id, low_stock, expiry_days) VALUES (?, ?, ?, ?)
+                ON CONFLICT ({key}) DO UPDATE SET low_stock = excluded.low_stock, expiry_days = excluded.expiry_days""",
+            (category, medicine_id, low_stock, expiry_days)
+        )
+        _evaluate_alerts(c)
+
+
+def delete_alert_threshold(threshold_id):
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM alert_thresholds WHERE id = ?", (threshold_id,))
+        _evaluate_alerts(c)
+
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+
+def _run_alert_evaluator(interval, stop):
+    while not stop.is_set():
+        try:
+            refresh_alerts()
+        except sqlite3.Error:
+            pass  # try again next round, e.g. if the database was busy
+        stop.wait(interval)
+    close_db()
+
+
+# Start (once per process) a daemon thread that refreshes the alerts table every
+# `interval` seconds, so date-based alerts stay current without any writes
+def start_alert_evaluator(interval=600):
+    global _evaluator
+    with _evaluator_lock:
+        if _evaluator is None or not _evaluator[0].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=_run_alert_evaluator, args=(interval, stop), name="alert-evaluator", daemon=True
+            )
+            thread.start()
+            _evaluator = (thread, stop)
+
+
+# Stop the evaluator thread, waiting for a refresh in progress to finish
+def stop_alert_evaluator(timeout=10):
+    global _evaluator
+    with _evaluator_lock:
+        evaluator, _evaluator = _evaluator, None
+    if evaluator is not None:
+        thread, stop = evaluator
+        stop.set()
+        thread.join(timeout)
+
+
+
+# ─── SALES ARCHIVES ────────────────────────────────────────────────────────────
+# Closed years of sales can be moved out of the main database into one file
+# per year (next to the database, in "<name>-archive/sales-<year>.db"), so the
+# hot database and its backups stay small. The daily rollups keep every year,
+# so analytics never need the archives; the dashboard totals come from the
+# stored per-archive summaries. Reports and fetch_sales ATTACH the archives
+# their date range reaches into, and read them with the hot table as one.
+
+# Columns read from archived and hot sales alike
+SALES_COLUMNS = "id, customer_id, medicine_id, quantity, total, date, prescription_id, unit_price, unit_cost"
+
+# SQLite's default limit on attached databases per connection
+MAX_ATTACHED = 10
+
+
+# Archive paths are stored relative to the database's folder
+def _archive_file(path):
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), path)
+
+
+# Attach the (year, path) archives to `conn` unless already attached and
+# return their schema names. Archives attached for earlier queries stay
+# attached, unless room is needed under MAX_ATTACHED.
+def _attach_archives(conn, archives):
+    if len(archives) > MAX_ATTACHED:
+        raise ValueError(f"At most {MAX_ATTACHED} archived years can be read at once.")
+    names = [f"archive_{year}" for year, _ in archives]
+    attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith("archive_")]
+    missing = [(name, path) for name, (_, path) in zip(names, archives) if name not in attached]
+    surplus = len(attached) + len(missing) - MAX_ATTACHED
+    for name in [name for name in attached if name not in names][:max(surplus, 0)]:
+        conn.execute(f"DETACH DATABASE {name}")
+    for name, path in missing:
+        path = _archive_file(path)
+        if not os.path.exists(path):
+            # ATTACH would quietly create an empty database instead
+            raise FileNotFoundError(f"Sales archive {path} is missing.")
+        conn.execute(f"ATTACH DATABASE ? AS {name}", (path,))
+    return names
+
+
+# SQL for the sales table extended with the archived years that dates between
+# `start_date` and `end_date` fall in (every archived year by default),
+# attaching them to `conn` as needed. Just "sales" when none are archived.
+def _sales_source(conn, start_date="0000", end_date="9999"):
+    archives = conn.execute(
+        """SELECT year, path FROM sales_archives
+           WHERE year BETWEEN CAST(substr(?, 1, 4) AS INTEGER) AND CAST(substr(?, 1, 4) AS INTEGER)
+           ORDER BY year""",
+        (start_date, end_date)
+    ).fetchall()
+    if not archives:
+        return "sales"
+    selects = [f"SELECT {SALES_COLUMNS} FROM {name}.sales" for name in _attach_archives(conn, archives)]
+    selects.append(f"SELECT {SALES_COLUMNS} FROM main.sales")
+    return f"({' UNION ALL '.join(selects)})"
+
+
+# Years whose sales have been archived, as (year, path, sales, revenue)
+def fetch_sales_archives():
+    c = connect_db().cursor()
+    c.execute("SELECT year, path, rows, revenue FROM sales_archives ORDER BY year")
+    return c.fetchall()
+
+
+# Move the sales of a closed `year` into its own archive file and return how
+# many were moved. The copy is written to a temporary file and renamed into
+# place before anything is deleted, and the archive only counts once its
+# summary rows commit in the same transaction as the delete, so a failure at
+# any step leaves every sale readable exactly once.
+def archive_sales(year):
+    year = int(year)
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} is not over yet.")
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sales_archives WHERE year = ?", (year,))
+    if c.fetchone():
+        raise ValueError(f"Sales for {year} are already archived.")
+
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    stem = os.path.splitext(os.path.basename(DB_PATH))[0]
+    relative = os.path.join(f"{stem}-archive", f"sales-{year}.db")
+    path = _archive_file(relative)
+    tmp = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'sales'")
+    create = re.sub(r'^CREATE TABLE "?sales"?', "CREATE TABLE archive_new.sales", c.fetchone()[0])
+    c.execute("ATTACH DATABASE ? AS archive_new", (tmp,))
+    try:
+        c.execute(create)
+        c.execute("BEGIN")
+        c.execute("INSERT INTO archive_new.sales SELECT * FROM main.sales WHERE date >= ? AND date < ?", (start, end))
+        c.execute("""CREATE INDEX archive_new.idx_sales_date
+                     ON sales(date, customer_id, medicine_id, quantity, total, prescription_id)""")
+        c.execute("SELECT COUNT(*), MAX(id) FROM archive_new.sales")
+        copied, copied_last_id = c.fetchone()
+        conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        c.execute("DETACH DATABASE archive_new")
+    if not copied:
+        os.remove(tmp)
+        return 0
+    os.replace(tmp, path)
+
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT COUNT(*), COALESCE(SUM(total), 0), MIN(id), MAX(id) FROM sales WHERE date >= ? AND date < ?",
+            (start, end)
+        )
+        rows, revenue, first_id, last_id = c.fetchone()
+        if (rows, last_id) != (copied, copied_last_id):
+            raise RuntimeError(f"Sales for {year} changed while they were being archived; try again.")
+        c.execute(
+            """INSERT INTO sales_archives (year, path, rows, revenue, first_id, last_id, archived_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (year, relative, rows, revenue, first_id, last_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+        c.execute("DELETE FROM sales WHERE date >= ? AND date < ?", (start, end))
+    return rows
+
+
+# Archive every year before `before_year` (default: this year) that still has
+# sales in the main database; returns [(year, sales moved)]. Years already
+# archived are skipped, so sales back-dated into them simply stay in the main
+# database.
+def archive_closed_years(before_year=None):
+    before_year = before_year or datetime.now().year
+    c = connect_db().cursor()
+    c.execute("SELECT MIN(date) FROM sales")
+    first = c.fetchone()[0]
+    c.execute("SELECT year FROM sales_archives")
+    archived = {year for (year,) in c.fetchall()}
+    moved = []
+    for year in range(int(first[:4]) if first else before_year, before_year):
+        if year not in archived:
+            rows = archive_sales(year)
+            if rows:
+                moved.append((year, rows))
+    return moved
+
+
+# Archives written before sales kept their prices get the same columns and
+# backfill the main table had in migration 10
+def _upgrade_archives(conn):
+    archives = conn.execute("SELECT year, path FROM sales_archives").fetchall()
+    for archive in archives:
+        name = _attach_archives(conn, [archive])[0]
+        columns = [row[1] for row in conn.execute(f"PRAGMA {name}.table_info(sales)")]
+        if "unit_cost" in columns:
+            continue
+        with transaction():
+            conn.execute(f"ALTER TABLE {name}.sales ADD COLUMN unit_price REAL")
+            conn.execute(f"ALTER TABLE {name}.sales ADD COLUMN unit_cost REAL")
+            conn.execute(BACKFILL_SALE_PRICES.format(sales=f"{name}.sales"))
+
+
+# ─── SALES LEDGER ──────────────────────────────────────────────────────────────
+# Running totals of every sale line, updated in the same transaction as the
+# sale, so the dashboard totals are one-row reads however long the history.
+# Money is kept in whole cents and every line is rounded the same way, by
+# _ledger_line, when it is added and when the totals are recomputed, so the
+# ledger and a recount agree exactly rather than to within float error.
+
+LEDGER_FIELDS = ["lines", "quantity", "revenue_cents", "profit_cents"]
+
+
+# (revenue, profit) of one sale line in cents. Lines of unknown cost (sales
+# of medicines deleted before costs were recorded) add no profit.
+def _ledger_line(quantity, total, unit_cost):
+    revenue = round(total * 100)
+    if unit_cost is None:
+        return revenue, 0
+    return revenue, revenue - round(quantity * unit_cost * 100)
+
+
+# Add (quantity, total, unit_cost) sale lines to the ledger
+def _add_to_ledger(c, lines):
+    quantity = revenue = profit = 0
+    for line_quantity, total, unit_cost in lines:
+        line_revenue, line_profit = _ledger_line(line_quantity, total, unit_cost)
+        quantity += line_quantity
+        revenue += line_revenue
+        profit += line_profit
+    c.execute(
+        """UPDATE sales_ledger SET lines = lines + ?, quantity = quantity + ?,
+                                   revenue_cents = revenue_cents + ?, profit_cents = profit_cents + ?""",
+        (len(lines), quantity, revenue, profit)
+    )
+
+
+# Ledger totals counted from the sale rows of `source`
+def _count_ledger(c, source, chunk_size=50000):
+    totals = dict.fromkeys(LEDGER_FIELDS, 0)
+    c.execute(f"SELECT quantity, total, unit_cost FROM {source}")
+    for rows in iter(lambda: c.fetchmany(chunk_size), []):
+        for quantity, total, unit_cost in rows:
+            revenue, profit = _ledger_line(quantity, total, unit_cost)
+            totals["lines"] += 1
+            totals["quantity"] += quantity
+            totals["revenue_cents"] += revenue
+            totals["profit_cents"] += profit
+    return totals
+
+
+# Current ledger totals as a dict, or None before the ledger is first built
+def fetch_ledger():
+    c = connect_db().cursor()
+    c.execute(f"SELECT {', '.join(LEDGER_FIELDS)} FROM sales_ledger")
+    row = c.fetchone()
+    return dict(zip(LEDGER_FIELDS, row)) if row else None
+
+
+# Recount the ledger from every sale, archives included, and store the result
+def rebuild_ledger():
+    source = _sales_source(connect_db())
+    with transaction() as conn:
+        totals = _count_ledger(conn.cursor(), source)
+        conn.execute(
+            f"INSERT OR REPLACE INTO sales_ledger (id, {', '.join(LEDGER_FIELDS)}) VALUES (1, ?, ?, ?, ?)",
+            [totals[field] for field in LEDGER_FIELDS]
+        )
+    return totals
+
+
+# Recount the totals from every sale, archives included, and compare them with
+# the ledger in one snapshot. Returns (ledger, recounted); they are equal when
+# the ledger is correct.
+def verify_ledger():
+    conn = connect_db()
+    source = _sales_source(conn)
+    conn.execute("BEGIN")
+    try:
+        ledger = fetch_ledger()
+        recounted = _count_ledger(conn.cursor(), source)
+    finally:
+        conn.commit()
+    return ledger, recounted
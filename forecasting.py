@@ -0,0 +1,92 @@
+from datetime import date
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import database
+
+# Demand forecasts and reorder suggestions for every medicine at once.
+# Daily demand comes from the per-day medicine totals kept by analytics.py, in
+# long form (one row per medicine per day with sales). Every statistic is a
+# weighted sum over those rows, computed with np.bincount, so the cost grows
+# with the number of (day, medicine) rows and never loops per medicine or
+# builds a dense medicines × days matrix.
+
+METHODS = ["Exponential smoothing", "Moving average"]
+
+
+# Daily demand forecast and standard deviation per item.
+# `positions` (0..n_items-1), `ages` (days before the as-of day, 0 = that day)
+# and `quantities` describe the demand rows inside the last `history_days`
+# days; days without a row count as zero demand. An (item, day) pair may
+# appear in several rows (recent sales are one row each), so rows are summed
+# into daily totals before squaring.
+def demand_stats(positions, ages, quantities, n_items, history_days,
+                 method="Exponential smoothing", alpha=0.3, window=28):
+    days, rows = np.unique(np.asarray(positions, dtype=np.int64) * history_days + ages, return_inverse=True)
+    quantities = np.bincount(rows, weights=np.asarray(quantities, dtype=np.float64), minlength=len(days))
+    positions, ages = days // history_days, days % history_days
+    total = np.bincount(positions, weights=quantities, minlength=n_items)
+    squares = np.bincount(positions, weights=quantities ** 2, minlength=n_items)
+    mean = total / history_days
+    std = np.sqrt(np.maximum(squares / history_days - mean ** 2, 0.0))
+
+    if method == "Moving average":
+        recent = ages < window
+        forecast = np.bincount(positions[recent], weights=quantities[recent], minlength=n_items) / window
+    else:
+        # Simple exponential smoothing started from the history mean, unrolled:
+        # s = sum(alpha * (1 - alpha) ** age * demand) + (1 - alpha) ** history_days * mean
+        weights = alpha * (1.0 - alpha) ** ages
+        forecast = np.bincount(positions, weights=weights * quantities, minlength=n_items)
+        forecast += (1.0 - alpha) ** history_days * mean
+    return forecast, std
+
+
+# Reorder plan for the whole catalog as a DataFrame indexed by medicine id:
+# name, stock, daily forecast, demand std, reorder point, order quantity and
+# days of cover. The reorder point covers forecast demand over the lead time
+# plus safety stock for `service_level`; when stock is at or below it the
+# suggested order brings stock up to cover the lead time and review period.
+def reorder_plan(lead_time_days=7, review_days=14, service_level=0.95, history_days=365,
+                 method="Exponential smoothing", alpha=0.3, window=28, as_of=None):
+    as_of = pd.Timestamp(as_of or date.today())
+    start = as_of - pd.Timedelta(days=history_days - 1)
+    catalog = database.medicine_catalog()
+    ids = np.array(sorted(catalog.names), dtype=np.int64)
+
+    base, recent = analytics.sales_frames()["medicines"]
+    demand = pd.concat([base.loc[start:as_of], recent.loc[start:as_of]])
+    # Sales of deleted medicines are left out
+    medicine_ids = demand["medicine_id"].to_numpy()
+    known = np.isin(medicine_ids, ids)
+    positions = np.searchsorted(ids, medicine_ids[known])
+    ages = (as_of - demand.index[known]).days.to_numpy()
+
+    forecast, std = demand_stats(
+        positions, ages, demand["quantity"].to_numpy()[known],
+        len(ids), history_days, method, alpha, window
+    )
+
+    z = NormalDist().inv_cdf(service_level)
+    stock = np.array([catalog.stock[i] for i in ids.tolist()], dtype=np.float64)
+    reorder_point = np.ceil(forecast * lead_time_days + z * std * np.sqrt(lead_time_days))
+    order_up_to = reorder_point + np.ceil(forecast * review_days)
+    order_quantity = np.where(stock <= reorder_point, np.maximum(order_up_to - stock, 0.0), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(forecast > 0, stock / forecast, np.inf)
+
+    return pd.DataFrame(
+        {
+            "Name": [catalog.names[i] for i in ids.tolist()],
+            "Stock": stock.astype(np.int64),
+            "Daily Forecast": forecast.round(2),
+            "Demand Std": std.round(2),
+            "Reorder Point": reorder_point.astype(np.int64),
+            "Order Quantity": order_quantity.astype(np.int64),
+            "Days of Cover": days_of_cover.round(1),
+        },
+        index=pd.Index(ids, name="ID"),
+    )
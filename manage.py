@@ -0,0 +1,101 @@
+import argparse
+import sys
+
+import bulk_import
+import database
+import recommender
+import synthetic_data
+
+
+# Maintenance commands for the pharmacy database.
+# The database file is taken from the PHARMACY_DB environment variable.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pharmacy Management System maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-rollups", help="recompute the daily sales rollup tables from sales")
+    train = commands.add_parser("train-recommender", help="train and save the medicine recommender model")
+    train.add_argument("--data", default=recommender.DATA_PATH, help="symptom/medicine CSV file")
+    gen = commands.add_parser("generate-data", help="fill the database with synthetic medicines, customers and sales")
+    gen.add_argument("--medicines", type=int, default=50000)
+    gen.add_argument("--customers", type=int, default=200000)
+    gen.add_argument("--sales", type=int, default=5000000)
+    gen.add_argument("--years", type=int, default=3)
+    gen.add_argument("--seed", type=int, default=1)
+    imp = commands.add_parser("import", help="bulk import medicines or customers from a CSV file")
+    imp.add_argument("kind", choices=sorted(bulk_import.IMPORTERS))
+    imp.add_argument("csv_file")
+    archive = commands.add_parser("archive-sales", help="move closed years of sales into per-year archive files")
+    archive.add_argument("--before-year", type=int, help="archive years before this one (default: the current year)")
+    archive.add_argument("--vacuum", action="store_true", help="shrink the database file afterwards")
+    verify = commands.add_parser("verify-ledger", help="recount sales totals and reconcile them with the ledger")
+    verify.add_argument("--fix", action="store_true", help="replace the ledger with the recounted totals")
+    images = commands.add_parser("process-prescriptions", help="make processed copies and thumbnails of prescription images")
+    images.add_argument("--all", action="store_true", help="reprocess every image, not only new ones")
+    images.add_argument("--workers", type=int, help="worker processes (default: PRESCRIPTION_WORKERS or up to 4)")
+
+    args = parser.parse_args(argv)
+    database.init_db()
+
+    if args.command == "rebuild-rollups":
+        database.rebuild_rollups()
+        print("Daily sales rollups rebuilt.")
+    elif args.command == "train-recommender":
+        artifact = recommender.train_and_save(args.data)
+        print(f"Saved {recommender.artifact_path(artifact['data_hash'])}")
+    elif args.command == "generate-data":
+        synthetic_data.generate(args.medicines, args.customers, args.sales, args.years, args.seed, progress=print)
+    elif args.command == "import":
+        with open(args.csv_file, newline="", encoding="utf-8-sig") as f:
+            try:
+                inserted, errors = bulk_import.IMPORTERS[args.kind](f)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 2
+        for line, error in errors:
+            print(f"Line {line}: {error}", file=sys.stderr)
+        print(f"Imported {inserted} {args.kind}, skipped {len(errors)} invalid row(s).")
+        return 1 if errors else 0
+    elif args.command == "archive-sales":
+        try:
+            moved = database.archive_closed_years(args.before_year)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        for year, rows in moved:
+            print(f"Archived {rows} sales from {year}.")
+        if not moved:
+            print("Nothing to archive.")
+        archives = database.fetch_sales_archives()
+        if archives:
+            print(f"{'year':>6s} {'sales':>10s} {'revenue':>16s}  file")
+            for year, path, rows, revenue in archives:
+                print(f"{year:>6d} {rows:>10d} {revenue:>16.2f}  {path}")
+        if args.vacuum:
+            database.connect_db().execute("VACUUM")
+            print("Database compacted.")
+    elif args.command == "verify-ledger":
+        ledger, recounted = database.verify_ledger()
+        ledger = ledger or dict.fromkeys(database.LEDGER_FIELDS)
+        print(f"{'':15s} {'ledger':>16s} {'recounted':>16s}")
+        for field in database.LEDGER_FIELDS:
+            print(f"{field:15s} {str(ledger[field]):>16s} {recounted[field]:>16d}")
+        if ledger == recounted:
+            print("Ledger matches the sales.")
+        elif args.fix:
+            database.rebuild_ledger()
+            print("Ledger rebuilt from the sales.")
+        else:
+            print("Ledger does not match the sales; run with --fix to rebuild it.", file=sys.stderr)
+            return 1
+    elif args.command == "process-prescriptions":
+        processed, failed, seconds = database.process_prescriptions(
+            args.all, args.workers, progress=lambda done, failed: print(f"{done} processed, {failed} failed")
+        )
+        rate = processed / seconds if seconds else 0.0
+        print(f"Processed {processed} image(s) in {seconds:.1f}s ({rate:.1f}/s), {failed} failed.")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
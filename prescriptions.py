@@ -0,0 +1,184 @@
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Prescription images live under the static folder so Streamlit can serve them
+PRESCRIPTION_DIR = os.path.join("static", "prescriptions")
+
+# Bytes read from an upload at a time
+CHUNK_SIZE = 1 << 16
+
+# Uploads that get a processed copy and a thumbnail
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# Processed copies are grayscale JPEGs no larger than VIEW_SIZE on their
+# longest side; thumbnails fit in THUMBNAIL_SIZE for tables and previews
+VIEW_SIZE = 1600
+VIEW_QUALITY = 80
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_QUALITY = 70
+
+# Worker processes for images processed in the background, PRESCRIPTION_WORKERS to override
+WORKERS = int(os.environ.get("PRESCRIPTION_WORKERS", 0)) or min(4, os.cpu_count() or 1)
+
+
+# SHA-256 of a file on disk, read in chunks
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Content-addressed location for a file: static/prescriptions/ab/abcdef….png
+def path_for(sha256, ext):
+    return os.path.join(PRESCRIPTION_DIR, sha256[:2], sha256 + ext)
+
+
+# Stream a file-like upload to disk while hashing it, and keep one copy per
+# distinct content. Returns (sha256, path, size); `path` may be a file that an
+# earlier identical upload already stored.
+def save_upload(upload, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    os.makedirs(PRESCRIPTION_DIR, exist_ok=True)
+    tmp = os.path.join(PRESCRIPTION_DIR, f".upload-{uuid.uuid4().hex}{ext}")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter(lambda: upload.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        path = path_for(sha256, ext)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return sha256, path, size
+
+
+# Where the processed copy and the thumbnail of a stored file go, next to it:
+# (…/abcdef….view.jpg, …/abcdef….thumb.jpg)
+def derived_paths(sha256):
+    return path_for(sha256, ".view.jpg"), path_for(sha256, ".thumb.jpg")
+
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _save_jpeg(image, path, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp, path)
+
+
+# Upright (EXIF orientation), grey copy of an open image no larger than `size`
+# (square, so it fits either way up)
+def _normalised(image, size):
+    from PIL import Image, ImageOps
+
+    # JPEGs decode straight to grey at a reduced scale, which is most of the
+    # work. The box keeps the photo's shape, or its short side would stop it.
+    scale = min(1.0, size[0] / max(image.size))
+    image.draft("L", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        # Transparent areas become white paper rather than black
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image.convert("RGBA"))
+    image = image.convert("L")
+    image.thumbnail(size)
+    # Rotating the reduced image is cheaper than rotating the full photo
+    return ImageOps.exif_transpose(image)
+
+
+# Write the processed copy of the image at `path` (upright, grey, no larger
+# than VIEW_SIZE) and its thumbnail as JPEGs. Runs in worker processes, so it
+# only touches files. Returns (view_path, thumbnail_path).
+def process_image(path, view_path, thumbnail_path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image = _normalised(image, (VIEW_SIZE, VIEW_SIZE))
+        _save_jpeg(image, view_path, VIEW_QUALITY)
+        image.thumbnail(THUMBNAIL_SIZE)
+        _save_jpeg(image, thumbnail_path, THUMBNAIL_QUALITY)
+    return view_path, thumbnail_path
+
+
+# Thumbnail JPEG bytes of an image file-like object, as it will be stored
+def thumbnail_bytes(f):
+    from PIL import Image
+
+    with Image.open(f) as image:
+        image = _normalised(image, THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=THUMBNAIL_QUALITY)
+    return out.getvalue()
+
+
+# process_image for the batch pool: failures come back as a message instead
+# of stopping the whole map
+def _process_quietly(job):
+    path, view_path, thumbnail_path = job
+    try:
+        return process_image(path, view_path, thumbnail_path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _new_pool(workers):
+    # spawn, not fork: the parent has threads and open SQLite connections
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Queue an image for processing on the background worker processes. The
+# Future resolves to (view_path, thumbnail_path) or raises what the worker did.
+def process_async(path, view_path, thumbnail_path):
+    global _pool
+    with _pool_lock:
+        for attempt in range(2):
+            if _pool is None:
+                _pool = _new_pool(WORKERS)
+            try:
+                return _pool.submit(process_image, path, view_path, thumbnail_path)
+            except BrokenProcessPool:
+                # A worker died (out of memory on a huge upload, say); start over
+                _pool = None
+                if attempt:
+                    raise
+
+
+# Process many (path, view_path, thumbnail_path) jobs on a pool of `workers`
+# processes, or in this process when workers is 1. Yields
+# (job, (view_path, thumbnail_path) or None, error or None) in job order.
+def process_batch(jobs, workers=None, chunksize=4):
+    jobs = list(jobs)
+    if (workers or WORKERS) == 1:
+        for job in jobs:
+            yield (job, *_process_quietly(job))
+        return
+    with _new_pool(workers or WORKERS) as pool:
+        for job, result in zip(jobs, pool.map(_process_quietly, jobs, chunksize=chunksize)):
+            yield (job, *result)
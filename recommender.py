@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Symptom → medicine training data, overridable with MEDICINE_DATA
+DATA_PATH = os.environ.get('MEDICINE_DATA', "C:\\Users\\Shlokam\\Desktop\\Static\\medicine_data.csv")
+
+# Where trained model artifacts are written, one file per dataset version
+MODEL_DIR = os.environ.get('MODEL_DIR', 'models')
+
+# Bumped whenever the artifact layout changes so stale pickles are ignored
+ARTIFACT_VERSION = 2
+
+
+# SHA-256 of the dataset file, read in chunks
+def dataset_hash(path=DATA_PATH):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_path(data_hash):
+    return os.path.join(MODEL_DIR, f"recommender-v{ARTIFACT_VERSION}-{data_hash[:16]}.pkl")
+
+
+# Linear symptom → medicine scorer. Queries are turned into a sparse bag of
+# symptom tokens and scored against every medicine in one sparse @ dense
+# product; softmax gives calibrated scores and argpartition picks the top k
+# without sorting every class.
+class Recommender:
+    def __init__(self, vectorizer, weights, bias, classes, known_symptoms):
+        self.vectorizer = vectorizer
+        self.analyzer = vectorizer.build_analyzer()
+        self.vocabulary = vectorizer.vocabulary_
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)  # (features, classes)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes = np.asarray(classes)
+        self.known_symptoms = known_symptoms
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["analyzer"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.analyzer = self.vectorizer.build_analyzer()
+
+    def _vectorize(self, texts):
+        from scipy.sparse import csr_matrix
+
+        indices, indptr = [], [0]
+        for text in texts:
+            indices.extend(self.vocabulary[tok] for tok in self.analyzer(text) if tok in self.vocabulary)
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        return csr_matrix((data, indices, indptr), shape=(len(texts), self.weights.shape[0]))
+
+    # Softmax scores for every medicine, one row per query
+    def scores(self, texts):
+        logits = self._vectorize(texts) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    # [(prediction, [(medicine, score), ...top k]), ...] for a list of queries
+    def recommend_batch(self, texts, k=3):
+        probas = self.scores(texts)
+        k = min(k, probas.shape[1])
+        top = np.argpartition(-probas, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(texts))[:, None]
+        order = np.argsort(-probas[rows, top], axis=1)
+        top = top[rows, order]
+        results = []
+        for i, idx in enumerate(top):
+            suggestions = list(zip(self.classes[idx].tolist(), probas[i, idx].tolist()))
+            results.append((suggestions[0][0], suggestions))
+        return results
+
+    def recommend(self, text, k=3):
+        return self.recommend_batch([text], k)[0]
+
+
+# Fit the symptom classifier and return the artifact dict (not saved)
+def train(data):
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    vectorizer = CountVectorizer()
+    X = vectorizer.fit_transform(data['symptoms'])
+    classifier = LogisticRegression(max_iter=1000)
+    classifier.fit(X, data['medicine'])
+
+    # Binary problems get a single coefficient row; expand to one per class
+    coef, intercept = classifier.coef_, classifier.intercept_
+    if len(classifier.classes_) == 2:
+        coef = np.vstack([-coef[0] / 2, coef[0] / 2])
+        intercept = np.array([-intercept[0] / 2, intercept[0] / 2])
+
+    known_symptoms = set()
+    for symptom_list in data['symptoms']:
+        known_symptoms.update(symptom.strip().lower() for symptom in symptom_list.split(','))
+
+    model = Recommender(vectorizer, coef.T, intercept, classifier.classes_, known_symptoms)
+    return {
+        "model": model,
+        "known_symptoms": known_symptoms,
+        "trained_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+# Train on the dataset at `path` and write the artifact for its hash.
+# Written to a temporary file first so readers never see a partial artifact.
+def train_and_save(path=DATA_PATH):
+    data_hash = dataset_hash(path)
+    artifact = train(pd.read_csv(path))
+    artifact["data_hash"] = data_hash
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    target = artifact_path(data_hash)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, target)
+    return artifact
+
+
+# Load the artifact matching the current dataset, training it only if the
+# dataset has changed since the last saved model
+def load_model(path=DATA_PATH):
+    target = artifact_path(dataset_hash(path))
+    if os.path.exists(target):
+        with open(target, 'rb') as f:
+            return pickle.load(f)
+    return train_and_save(path)
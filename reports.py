@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+
+from database import REPORT_COLUMNS, iter_report
+
+# Report exports are written here. They name customers, so the folder must not
+# be under static/, which Streamlit serves without the login check.
+EXPORT_DIR = "exports"
+
+# Where exports used to be written; anything left there is removed
+LEGACY_EXPORT_DIR = os.path.join("static", "exports")
+
+# Exports older than this are removed the next time a report is exported
+EXPORT_MAX_AGE = 3600
+
+# Largest export the app offers through st.download_button, which holds the
+# whole file in memory while serving it. Larger exports stay on the server
+# under EXPORT_DIR. PHARMACY_DOWNLOAD_MAX_MB to override.
+DOWNLOAD_MAX_BYTES = int(float(os.environ.get("PHARMACY_DOWNLOAD_MAX_MB", 25)) * 2 ** 20)
+
+FORMATS = {
+    "CSV": ".csv",
+    "JSON Lines": ".jsonl",
+    "Parquet": ".parquet",
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Encoded CSV, one piece per database chunk, header first
+def stream_csv(start_date, end_date, chunk_size=5000):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(REPORT_COLUMNS)
+    yield buf.getvalue().encode("utf-8")
+    for rows in iter_report(start_date, end_date, chunk_size):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+# Encoded JSON Lines, one object per sale, one piece per database chunk
+def stream_jsonl(start_date, end_date, chunk_size=5000):
+    for rows in iter_report(start_date, end_date, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(REPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+# Write a Parquet file one row group per database chunk (needs pyarrow)
+def write_parquet(start_date, end_date, path, chunk_size=50000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("date", pa.string()),
+        ("Customer", pa.string()),
+        ("Medicine", pa.string()),
+        ("quantity", pa.int64()),
+        ("total", pa.float64()),
+        ("prescription", pa.string()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in iter_report(start_date, end_date, chunk_size):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema
+            ))
+
+
+# Delete exports left in static/ by older versions, which anyone could fetch
+def remove_legacy_exports():
+    shutil.rmtree(LEGACY_EXPORT_DIR, ignore_errors=True)
+
+
+def _remove_stale_exports():
+    remove_legacy_exports()
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_MAX_AGE
+    for name in os.listdir(EXPORT_DIR):
+        folder = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(folder) < cutoff:
+                for f in os.listdir(folder):
+                    os.remove(os.path.join(folder, f))
+                os.rmdir(folder)
+        except OSError:
+            pass
+
+
+# Stream the report for a date range to a new file under EXPORT_DIR and
+# return its path. Each export gets its own random folder so concurrent
+# exports never clash.
+def export_report(start_date, end_date, fmt="CSV"):
+    _remove_stale_exports()
+    folder = os.path.join(EXPORT_DIR, uuid.uuid4().hex)
+    os.makedirs(folder)
+    path = os.path.join(folder, f"sales_report_{start_date}_{end_date}{FORMATS[fmt]}")
+
+    if fmt == "Parquet":
+        write_parquet(start_date, end_date, path)
+    else:
+        stream = stream_csv if fmt == "CSV" else stream_jsonl
+        with open(path, "wb") as f:
+            for piece in stream(start_date, end_date):
+                f.write(piece)
+    return path
+
+
+def downloadable(path):
+    return os.path.getsize(path) <= DOWNLOAD_MAX_BYTES
+
+
+# Contents of an export for st.download_button. Refuses exports larger than
+# DOWNLOAD_MAX_BYTES, so memory stays bounded whatever the date range.
+def read_export(path):
+    if not downloadable(path):
+        raise ValueError(f"{os.path.basename(path)} is larger than the {DOWNLOAD_MAX_BYTES / 2 ** 20:.1f} MB download limit.")
+    with open(path, "rb") as f:
+        return f.read()
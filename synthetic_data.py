@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import database
+
+CATEGORIES = [
+    "Analgesic", "Antibiotic", "Antacid", "Antihistamine", "Antiseptic", "Antiviral",
+    "Cardiac", "Cough & Cold", "Dermatology", "Diabetes", "Eye Care", "Gastro",
+    "Hypertension", "Multivitamin", "Neurology", "Orthopaedic", "Respiratory", "Supplement",
+]
+
+
+# Popularity weights following a Zipf-like curve: a few items get most of the traffic
+def _skewed_weights(n, exponent, rng):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _date_strings(seconds, start):
+    stamps = np.datetime64(start, "s") + seconds.astype("timedelta64[s]")
+    return np.char.replace(np.datetime_as_string(stamps, unit="s"), "T", " ")
+
+
+def _max_id(table):
+    c = database.connect_db().cursor()
+    c.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    return c.fetchone()[0]
+
+
+# Ids of the rows inserted after `after`, in insertion order. AUTOINCREMENT
+# never reuses the ids of deleted rows, so they can't be predicted from MAX(id).
+def _ids_after(table, after):
+    c = database.connect_db().cursor()
+    c.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id", (after,))
+    return np.array([row[0] for row in c.fetchall()], dtype=np.int64)
+
+
+# Fill the configured database with synthetic medicines, customers and sales.
+# Medicine and customer popularity are skewed, sales spread over `years` years
+# up to today, and the derived tables (lots, rollups, ledger, alerts) are rebuilt.
+def generate(medicines=5000, customers=20000, sales=500000, years=3, seed=1,
+             chunk_size=100000, progress=None):
+    rng = np.random.default_rng(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    buy_prices = np.round(rng.lognormal(3.0, 0.8, medicines), 2)
+    sell_prices = np.round(buy_prices * rng.uniform(1.1, 1.6, medicines), 2)
+    stock = rng.integers(0, 500, medicines)
+    expiry = _date_strings(rng.integers(-30, 3 * 365, medicines) * 86400, today)
+    categories = rng.integers(0, len(CATEGORIES), medicines)
+    last_medicine = _max_id("medicines")
+    database.add_medicines_bulk(
+        (f"Medicine {i}", CATEGORIES[categories[i]], float(buy_prices[i]), float(sell_prices[i]),
+         int(stock[i]), str(expiry[i])[:10])
+        for i in range(medicines)
+    )
+    medicine_ids = _ids_after("medicines", last_medicine)
+    if progress:
+        progress(f"{medicines} medicines")
+
+    last_customer = _max_id("customers")
+    contacts = rng.integers(6_000_000_000, 9_999_999_999, customers)
+    database.add_customers_bulk(
+        (f"Customer {i}", str(contacts[i]), f"{i} Synthetic Street")
+        for i in range(customers)
+    )
+    customer_ids = _ids_after("customers", last_customer)
+    if progress:
+        progress(f"{customers} customers")
+
+    medicine_weights = _skewed_weights(medicines, 1.1, rng)
+    customer_weights = _skewed_weights(customers, 0.8, rng)
+    start = today - timedelta(days=365 * years)
+    span = int((today - start).total_seconds())
+
+    # Sales grow over time: sqrt skews the timestamps towards recent dates.
+    # Sorted up front so sale ids follow the calendar, as they would for real.
+    offsets = np.sort((np.sqrt(rng.random(sales)) * span).astype(np.int64))
+
+    conn = database.connect_db()
+    done = 0
+    while done < sales:
+        n = min(chunk_size, sales - done)
+        med = rng.choice(medicines, n, p=medicine_weights)
+        cust = rng.choice(customers, n, p=customer_weights)
+        qty = rng.geometric(0.5, n)
+        dates = _date_strings(offsets[done:done + n], start)
+        rows = zip(
+            customer_ids[cust].tolist(),
+            medicine_ids[med].tolist(),
+            qty.tolist(),
+            np.round(qty * sell_prices[med], 2).tolist(),
+            dates.tolist(),
+            sell_prices[med].tolist(),
+            buy_prices[med].tolist(),
+        )
+        with database.transaction():
+            conn.executemany(
+                """INSERT INTO sales (customer_id, medicine_id, quantity, total, date, unit_price, unit_cost)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+        done += n
+        if progress:
+            progress(f"{done}/{sales} sales")
+
+    database.rebuild_rollups()
+    database.rebuild_ledger()
+    database.refresh_alerts()
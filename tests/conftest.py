@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+# A fresh, migrated database in a temporary directory, which is also the
+# working directory so static/ files land there
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database.configure_db(str(tmp_path / "pharmacy.db"))
+    yield database
+    database.stop_alert_evaluator()
+    database.close_db()
@@ -0,0 +1,19 @@
+import threading
+import time
+
+
+def test_evaluator_refreshes_alerts_until_stopped(db):
+    # Written behind the alert rules' back, as a day rolling over would leave it
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO medicines (name, category, buy_price, sell_price, stock, expiry_date)"
+                     " VALUES ('Paracetamol', 'Analgesic', 1.0, 2.0, 50, '2000-01-01')")
+    assert db.fetch_alerts("expired") == []
+
+    db.start_alert_evaluator(interval=0.05)
+    deadline = time.monotonic() + 10
+    while not db.fetch_alerts("expired") and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert [row[1] for row in db.fetch_alerts("expired")] == ["Paracetamol"]
+
+    db.stop_alert_evaluator()
+    assert not any(thread.name == "alert-evaluator" for thread in threading.enumerate())
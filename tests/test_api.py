@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+import api
+import database
+import synthetic_data
+
+
+# api.serve() on an ephemeral port in a background event loop; yields the port
+@pytest.fixture
+def server(db):
+    listening = threading.Event()
+    running = []
+
+    async def run():
+        running.append((asyncio.get_running_loop(), asyncio.current_task()))
+        await api.serve("127.0.0.1", 0, workers=4, listening=lambda port: (running.append(port), listening.set()))
+
+    def thread_main():
+        with contextlib.suppress(asyncio.CancelledError):
+            asyncio.run(run())
+
+    thread = threading.Thread(target=thread_main, daemon=True)
+    thread.start()
+    assert listening.wait(10)
+    (loop, task), port = running
+    yield port
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(10)
+
+
+def request(conn, method, path, payload=None, headers=None):
+    body = payload if payload is None or isinstance(payload, str) else json.dumps(payload)
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read() or b"null"), response
+
+
+# Send raw bytes and return everything the server writes before closing
+def raw(port, data):
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(data)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@pytest.fixture
+def stocked(db):
+    medicine_id = db.add_medicine("Paracetamol", "Analgesic", 1.0, 2.0, 0, "2099-12-31")
+    db.add_lot(medicine_id, 5, "2099-12-31")
+    customer_id = db.add_customer("Asha", "9876543210", "1 Main Street")
+    return medicine_id, customer_id
+
+
+def test_requests_share_a_keep_alive_connection(server):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    status, payload, response = request(conn, "GET", "/health")
+    assert (status, payload) == (200, {"ok": True})
+    assert response.getheader("Connection") == "keep-alive"
+    sock = conn.sock
+    assert request(conn, "GET", "/medicines")[0] == 200
+    assert conn.sock is sock
+    conn.close()
+
+
+def test_error_statuses(server, monkeypatch):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    assert request(conn, "GET", "/nope")[0] == 404
+    assert request(conn, "DELETE", "/medicines")[0] == 405
+    status, payload, _ = request(conn, "POST", "/customers", {"name": "x"})
+    assert status == 400 and "contact" in payload["error"]
+    assert request(conn, "POST", "/sales", "{not json")[0] == 400
+    status, payload, _ = request(conn, "POST", "/sales/batch", {"sales": [{}] * (api.MAX_BATCH + 1)})
+    assert status == 413
+
+    monkeypatch.setattr(api, "API_TOKEN", "secret")
+    assert request(conn, "GET", "/health")[0] == 401
+    assert request(conn, "GET", "/health", headers={"Authorization": "Bearer secret"})[0] == 200
+    conn.close()
+
+
+def test_oversized_body_is_refused_and_the_connection_closed(server, monkeypatch):
+    monkeypatch.setattr(api, "MAX_BODY", 10)
+    response = raw(server, b"POST /sales HTTP/1.1\r\nContent-Length: 11\r\n\r\n{\"a\": 1234}GET /health HTTP/1.1\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 413 ")
+    assert b"Connection: close" in response and response.count(b"HTTP/1.1") == 1
+
+
+def test_bad_content_length_closes_the_connection(server):
+    # The body must not be read as the next request
+    response = raw(server, b"POST /sales HTTP/1.1\r\nContent-Length: abc\r\n\r\nGET /health HTTP/1.1\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert response.count(b"HTTP/1.1") == 1
+
+
+def test_chunked_request_bodies_are_rejected(server):
+    response = raw(server, b"POST /sales HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+                           b"2\r\n{}\r\n0\r\n\r\nGET /health HTTP/1.1\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response and response.count(b"HTTP/1.1") == 1
+
+
+def test_batch_reports_each_sale(server, stocked):
+    medicine_id, customer_id = stocked
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    status, payload, _ = request(conn, "POST", "/sales/batch", {"sales": [
+        {"customer_id": customer_id, "lines": [{"medicine_id": medicine_id, "quantity": 2}]},
+        {"customer_id": customer_id, "lines": [{"medicine_id": medicine_id, "quantity": 50}]},
+        {"customer_id": 999999, "lines": [{"medicine_id": medicine_id, "quantity": 1}]},
+        {"customer_id": customer_id, "lines": []},
+        {"customer_id": customer_id, "lines": [{"medicine_id": medicine_id, "quantity": 3}]},
+    ]})
+    conn.close()
+    assert status == 200
+    assert [result["ok"] for result in payload["results"]] == [True, False, False, False, True]
+    assert payload["results"][2]["error"] == "Customer not found."
+    assert "lines" in payload["results"][3]["error"]
+    assert database.medicine_catalog().stock[medicine_id] == 0
+
+
+def test_inventory_changes_include_deletes(server, stocked):
+    medicine_id, _ = stocked
+    other = database.add_medicine("Ibuprofen", "Analgesic", 1.0, 2.0, 3, "2099-12-31")
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    _, first, _ = request(conn, "GET", "/inventory/changes?since=0")
+    assert {row["id"] for row in first["changes"]} == {medicine_id, other}
+
+    database.delete_medicine(other)
+    database.update_medicine(medicine_id, "Paracetamol 500", "Analgesic", 1.0, 2.5, 5, "2099-12-31")
+    _, second, _ = request(conn, "GET", f"/inventory/changes?since={first['next_since']}")
+    assert second["deleted"] == [other]
+    assert [(row["id"], row["name"]) for row in second["changes"]] == [(medicine_id, "Paracetamol 500")]
+    assert second["next_since"] > first["next_since"]
+
+    _, third, _ = request(conn, "GET", f"/inventory/changes?since={second['next_since']}")
+    assert third == {"changes": [], "deleted": [], "next_since": second["next_since"]}
+    conn.close()
+
+
+def test_report_stops_reading_when_the_client_disconnects(server, monkeypatch):
+    synthetic_data.generate(medicines=10, customers=10, sales=20000, years=1)
+    monkeypatch.setattr(api, "REPORT_CHUNK", 50)
+    closed = threading.Event()
+    rows_read = []
+    iter_report = database.iter_report
+
+    def tracked(*args):
+        try:
+            for rows in iter_report(*args):
+                rows_read.append(len(rows))
+                yield rows
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(database, "iter_report", tracked)
+    sock = socket.create_connection(("127.0.0.1", server), timeout=10)
+    sock.sendall(b"GET /reports/sales?start=0000&end=9999 HTTP/1.1\r\n\r\n")
+    assert sock.recv(4096).startswith(b"HTTP/1.1 200 ")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+    sock.close()
+
+    assert closed.wait(10)
+    assert sum(rows_read) < 20000
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    assert request(conn, "GET", "/health")[0] == 200
+    conn.close()
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+import synthetic_data
+
+
+def test_archiving_keeps_totals(db):
+    synthetic_data.generate(medicines=20, customers=30, sales=2000, years=2)
+    before = (db.calculate_total_sales(), db.calculate_total_profit(), db.fetch_ledger())
+
+    moved = db.archive_closed_years()
+
+    assert moved and all(year < datetime.now().year for year, _ in moved)
+    assert [(year, rows) for year, _, rows, _ in db.fetch_sales_archives()] == moved
+    assert (db.calculate_total_sales(), db.calculate_total_profit(), db.fetch_ledger()) == before
+    ledger, recounted = db.verify_ledger()
+    assert ledger == recounted
@@ -0,0 +1,21 @@
+import io
+
+import bulk_import
+
+HEADER = "name,category,buy_price,sell_price,stock,expiry_date\n"
+
+
+def test_non_finite_prices_are_reported_per_row(db):
+    csv_file = io.StringIO(
+        HEADER
+        + "Paracetamol,Analgesic,1.5,2.0,10,2099-12-31\n"
+        + "Ibuprofen,Analgesic,nan,2.0,10,2099-12-31\n"
+        + "Cetirizine,Antihistamine,1.0,inf,10,2099-12-31\n"
+        + "Omeprazole,Antacid,-inf,3.0,10,2099-12-31\n"
+    )
+    inserted, errors = bulk_import.import_medicines(csv_file)
+
+    assert inserted == 1
+    assert [line for line, _ in errors] == [3, 4, 5]
+    assert all(error == "Prices must be finite numbers." for _, error in errors)
+    assert [row[1] for row in db.fetch_medicines()] == ["Paracetamol"]
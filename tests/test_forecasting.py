@@ -0,0 +1,36 @@
+from datetime import date
+
+import numpy as np
+
+import analytics
+import forecasting
+
+
+def test_repeated_rows_for_a_day_are_summed_before_squaring():
+    # Ten one-unit rows on one day are one day of demand 10
+    split = forecasting.demand_stats(np.zeros(10, dtype=np.int64), np.zeros(10, dtype=np.int64),
+                                     np.ones(10), 1, 30)
+    summed = forecasting.demand_stats(np.array([0]), np.array([0]), np.array([10.0]), 1, 30)
+    np.testing.assert_allclose(split, summed)
+
+
+def test_recent_sales_and_rollups_give_the_same_plan(db):
+    medicine_id = db.add_medicine("Paracetamol", "Analgesic", 1.0, 2.0, 0, "2099-12-31")
+    db.add_lot(medicine_id, 1000, "2099-12-31")
+    customer_id = db.add_customer("Asha", "9876543210", "1 Main Street")
+    analytics.sales_frames()
+    for _ in range(10):
+        assert db.record_sales_batch(customer_id, [(medicine_id, 1)])[0]
+
+    # Still in the cached frame of recent sales, one row per sale
+    recent = forecasting.reorder_plan(history_days=30, as_of=date.today())
+    assert len(analytics.sales_frames()["medicines"][1]) == 10
+
+    # Reloaded from the daily rollups, one row per day
+    analytics._state = None
+    rolled_up = forecasting.reorder_plan(history_days=30, as_of=date.today())
+    assert len(analytics.sales_frames()["medicines"][1]) == 0
+
+    assert recent.loc[medicine_id, "Demand Std"] == rolled_up.loc[medicine_id, "Demand Std"]
+    assert recent.loc[medicine_id, "Reorder Point"] == rolled_up.loc[medicine_id, "Reorder Point"]
+    np.testing.assert_allclose(recent.loc[medicine_id, "Demand Std"], np.sqrt(100 / 30 - (10 / 30) ** 2), atol=0.01)
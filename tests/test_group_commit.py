@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+import database
+
+
+def _add(c, name):
+    c.execute("INSERT INTO customers (name, contact, address) VALUES (?, '9876543210', 'x')", (name,))
+    return name
+
+
+def _add_then_roll_back(c, name):
+    _add(c, name)
+    raise database._Rollback(name)
+
+
+def _add_then_fail(c, name):
+    _add(c, name)
+    raise ValueError(name)
+
+
+def test_a_failing_write_does_not_affect_its_group(db, monkeypatch):
+    groups = []
+    commit_group = db._commit_group
+
+    def recording(group):
+        groups.append([args for _, args, _, _ in group])
+        commit_group(group)
+
+    monkeypatch.setattr(db, "_commit_group", recording)
+
+    # Hold the writer so the next four requests queue up and share one commit
+    release = threading.Event()
+    blocker = db.submit_write(lambda c: release.wait(10))
+    futures = [
+        db.submit_write(_add, "first"),
+        db.submit_write(_add_then_roll_back, "rolled back"),
+        db.submit_write(_add_then_fail, "failed"),
+        db.submit_write(_add, "last"),
+    ]
+    release.set()
+
+    assert blocker.result(10)
+    assert futures[0].result(10) == "first"
+    assert futures[1].result(10) == "rolled back"
+    with pytest.raises(ValueError):
+        futures[2].result(10)
+    assert futures[3].result(10) == "last"
+    assert any({("first",), ("rolled back",), ("failed",), ("last",)} <= set(group) for group in groups)
+    assert sorted(name for _, name, *_ in db.fetch_customers()) == ["first", "last"]
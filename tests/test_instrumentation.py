@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def profiled(db):
+    saved = db.query_instrumentation()
+    db.set_query_instrumentation(True, slow_query_ms=0)
+    db.reset_query_stats()
+    yield db
+    db.set_query_instrumentation(*saved)
+    db.reset_query_stats()
+
+
+def test_iterated_cursors_finish_their_record(profiled):
+    db = profiled
+    db.begin_query_capture()
+    names = [row[1] for row in db.connect_db().execute("PRAGMA database_list")]
+    queries = db.end_query_capture("test")
+
+    assert "main" in names
+    [record] = [q for q in queries if q.sql == "PRAGMA database_list"]
+    assert record.rows == len(names)
+    assert record in db.slow_queries
+
+
+def test_writes_count_towards_the_rerun_that_submitted_them(profiled):
+    db = profiled
+    medicine_id = db.add_medicine("Paracetamol", "Analgesic", 1.0, 2.0, 0, "2099-12-31")
+    db.add_lot(medicine_id, 5, "2099-12-31")
+    customer_id = db.add_customer("Asha", "9876543210", "1 Main Street")
+
+    db.begin_query_capture()
+    assert db.record_sales_batch(customer_id, [(medicine_id, 2)])[0]
+    queries = db.end_query_capture("Record Sale")
+
+    [fefo] = [q for q in queries if q.sql.startswith("SELECT id, quantity FROM medicine_lots")]
+    assert fefo.rows == 1 and fefo in db.slow_queries
+    assert any(q.sql.startswith("INSERT INTO sales") for q in queries)
+    assert db.page_query_stats()["Record Sale"]["queries"] == len(queries)
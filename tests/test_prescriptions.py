@@ -0,0 +1,60 @@
+import io
+import os
+import sqlite3
+
+import pytest
+
+import prescriptions
+
+
+def test_refused_cart_stores_no_prescription(db):
+    medicine_id = db.add_medicine("Paracetamol", "Analgesic", 1.0, 2.0, 0, "2099-12-31")
+    db.add_lot(medicine_id, 2, "2099-12-31")
+    customer_id = db.add_customer("Asha", "9876543210", "1 Main Street")
+
+    ok, _ = db.record_sales_with_prescription(customer_id, [(medicine_id, 5)], io.BytesIO(b"scan"), "rx.pdf")
+    assert not ok
+    assert db.dashboard_summary()["prescriptions"] == 0
+
+    for _ in range(2):
+        ok, _ = db.record_sales_with_prescription(customer_id, [(medicine_id, 1)], io.BytesIO(b"scan"), "rx.pdf")
+        assert ok
+    assert db.dashboard_summary()["prescriptions"] == 1
+
+
+# A database at schema version 3, before prescriptions had their own table,
+# with one sale whose file is still in the old prescriptions/ folder
+def _legacy_database(db, path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    for step in db.MIGRATIONS[:3]:
+        step(c)
+    c.execute("PRAGMA user_version = 3")
+    c.execute("INSERT INTO medicines VALUES (1, 'Paracetamol', 'Analgesic', 1.0, 2.0, 5, '2099-12-31')")
+    c.execute("INSERT INTO customers VALUES (1, 'Asha', '9876543210', '1 Main Street')")
+    c.execute("INSERT INTO sales (customer_id, medicine_id, quantity, total, date, prescription)"
+              " VALUES (1, 1, 1, 2.0, '2020-01-01 10:00:00', 'prescriptions/rx.png')")
+    conn.commit()
+    conn.close()
+    os.makedirs("prescriptions")
+    with open("prescriptions/rx.png", "wb") as f:
+        f.write(b"legacy scan")
+
+
+def test_legacy_files_move_only_when_the_migration_commits(db, tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    _legacy_database(db, path)
+
+    def fail(path):
+        raise OSError("disk went away")
+
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(prescriptions, "hash_file", fail)
+        db.configure_db(path)
+    assert os.path.exists("prescriptions/rx.png")
+
+    db.configure_db(path)
+    assert not os.path.exists("prescriptions/rx.png")
+    with open("static/rx.png", "rb") as f:
+        assert f.read() == b"legacy scan"
+    assert db.fetch_sales()[0][-1] == "static/rx.png"
@@ -0,0 +1,22 @@
+import database
+
+
+# The detail column of EXPLAIN QUERY PLAN, one string per step
+def plan(query, params):
+    return [row[3] for row in database.connect_db().execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+def test_report_seeks_the_covering_date_index(db):
+    steps = plan(database.REPORT_QUERY.format(sales="sales"), ("2024-01-01", "2024-01-31"))
+    assert steps[0].startswith("SEARCH s USING COVERING INDEX idx_sales_date (date>? AND date<?)")
+    assert not any("SCAN" in step or "TEMP B-TREE" in step for step in steps)
+
+
+def test_expiring_count_seeks_the_expiry_index(db):
+    steps = plan(database.EXPIRING_QUERY, ("2024-01-08", "2024-01-01"))
+    assert steps == ["SEARCH medicines USING COVERING INDEX idx_medicines_expiry (expiry_date>? AND expiry_date<?)"]
+
+
+def test_lot_allocation_reads_lots_in_fefo_order_from_the_index(db):
+    steps = plan(database.FEFO_QUERY, (1, "2024-01-01"))
+    assert steps == ["SEARCH medicine_lots USING INDEX idx_lots_fefo (medicine_id=? AND expiry_date>?)"]
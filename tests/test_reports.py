@@ -0,0 +1,71 @@
+import os
+import tracemalloc
+
+import pytest
+
+import reports
+import synthetic_data
+
+SALES = 200000
+
+
+# Peak Python memory while exporting a range, and the size of the file
+def _export_peak(start_date, end_date):
+    tracemalloc.start()
+    try:
+        path = reports.export_report(start_date, end_date, "CSV")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, os.path.getsize(path)
+
+
+def test_export_streams_a_large_range_in_bounded_memory(db):
+    synthetic_data.generate(medicines=200, customers=500, sales=SALES, years=1)
+    c = db.connect_db().cursor()
+    c.execute("SELECT date FROM sales ORDER BY id")
+    dates = [row[0] for row in c.fetchall()]
+
+    small_peak, small_size = _export_peak(dates[0], dates[len(dates) // 4])
+    peak, size = _export_peak(dates[0], dates[-1])
+
+    # Four times the rows, about the same memory: only a chunk is held at once
+    assert size > 3.5 * small_size
+    assert peak < 1.5 * small_peak
+    assert peak < 8 * 2 ** 20 < size
+
+
+def test_downloads_are_capped_in_memory(db, monkeypatch):
+    synthetic_data.generate(medicines=200, customers=500, sales=SALES, years=1)
+    c = db.connect_db().cursor()
+    c.execute("SELECT date FROM sales ORDER BY id")
+    dates = [row[0] for row in c.fetchall()]
+    monkeypatch.setattr(reports, "DOWNLOAD_MAX_BYTES", 4 * 2 ** 20)
+
+    small = reports.export_report(dates[0], dates[len(dates) // 4])
+    large = reports.export_report(dates[0], dates[-1])
+    assert reports.downloadable(small) and not reports.downloadable(large)
+
+    # What the Generate Report page hands to st.download_button: at most the
+    # capped file is read, and a larger export is refused without reading it
+    tracemalloc.start()
+    try:
+        size = len(reports.read_export(small))
+        _, small_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        with pytest.raises(ValueError):
+            reports.read_export(large)
+        _, large_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert size == os.path.getsize(small)
+    assert small_peak < reports.DOWNLOAD_MAX_BYTES + 2 ** 20
+    assert large_peak < 2 ** 20
+
+
+def test_exports_are_not_under_the_static_folder(db):
+    os.makedirs(reports.LEGACY_EXPORT_DIR)
+    path = reports.export_report("2024-01-01", "2024-12-31", "CSV")
+    assert not os.path.abspath(path).startswith(os.path.abspath("static"))
+    assert not os.path.exists(reports.LEGACY_EXPORT_DIR)
+    assert reports.read_export(path).startswith(b"date,Customer,Medicine")
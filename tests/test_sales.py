@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def shop(db):
+    medicine_id = db.add_medicine("Paracetamol", "Analgesic", 1.0, 2.0, 0, "2099-12-31")
+    db.add_lot(medicine_id, 30, "2098-12-31")
+    db.add_lot(medicine_id, 20, "2099-12-31")
+    customer_id = db.add_customer("Asha", "9876543210", "1 Main Street")
+    return medicine_id, customer_id
+
+
+@pytest.mark.parametrize("group_commit", [True, False])
+def test_concurrent_sellers_never_oversell(db, shop, monkeypatch, group_commit):
+    monkeypatch.setattr(db, "GROUP_COMMIT", group_commit)
+    medicine_id, customer_id = shop
+
+    def sell(_):
+        ok, _ = db.record_sales_batch(customer_id, [(medicine_id, 3)])
+        db.close_db()
+        return ok
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        sold = sum(pool.map(sell, range(40)))
+
+    assert sold == 16
+    assert db.medicine_catalog().stock[medicine_id] == 2
+    assert sum(quantity for _, _, quantity, _, _ in db.fetch_lots(medicine_id)) == 2
+    assert sum(quantity for _, _, quantity, *_ in db.fetch_sales()) == 48
+
+
+def test_cart_with_a_line_out_of_stock_leaves_nothing(db, shop):
+    medicine_id, customer_id = shop
+    other = db.add_medicine("Ibuprofen", "Analgesic", 1.0, 3.0, 4, "2099-12-31")
+    lots = db.fetch_lots(medicine_id)
+    ledger = db.fetch_ledger()
+
+    ok, messages = db.record_sales_batch(customer_id, [(medicine_id, 10), (other, 5), (medicine_id, 1)])
+
+    assert not ok
+    assert messages[1] == "Not enough stock available."
+    assert messages[0] == messages[2] == "Sale cancelled: another item in this sale could not be sold."
+    assert db.fetch_sales() == []
+    assert db.fetch_lots(medicine_id) == lots
+    assert db.medicine_catalog().stock[medicine_id] == 50
+    assert db.medicine_catalog().stock[other] == 4
+    assert db.fetch_ledger() == ledger
+
+
+def test_expired_lots_are_not_sellable(db, shop):
+    medicine_id, customer_id = shop
+    db.add_lot(medicine_id, 5, "2000-01-01")
+
+    assert db.medicine_catalog().stock[medicine_id] == 55
+    assert db.sellable_stock(medicine_id) == 50
+    assert not db.record_sales_batch(customer_id, [(medicine_id, 51)])[0]
+    assert db.record_sales_batch(customer_id, [(medicine_id, 50)])[0]
+    assert db.sellable_stock(medicine_id) == 0
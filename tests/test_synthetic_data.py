@@ -0,0 +1,20 @@
+import synthetic_data
+
+
+def test_sales_refer_to_the_generated_rows_after_deletes(db):
+    # Deleted rows leave AUTOINCREMENT ahead of MAX(id)
+    medicine_id = db.add_medicine("Deleted", "Gone", 1.0, 2.0, 0, "2099-12-31")
+    customer_id = db.add_customer("Deleted", "9876543210", "Nowhere")
+    db.delete_medicine(medicine_id)
+    db.delete_customer(customer_id)
+
+    synthetic_data.generate(medicines=20, customers=30, sales=500, years=1)
+
+    c = db.connect_db().cursor()
+    c.execute("""SELECT COUNT(*) FROM sales s
+                 JOIN medicines m ON m.id = s.medicine_id
+                 JOIN customers c ON c.id = s.customer_id
+                 WHERE s.unit_cost = m.buy_price""")
+    assert c.fetchone()[0] == 500
+    c.execute("SELECT COUNT(*) FROM sales_daily_medicine WHERE medicine_id NOT IN (SELECT id FROM medicines)")
+    assert c.fetchone()[0] == 0
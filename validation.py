@@ -0,0 +1,31 @@
+import math
+
+# Validation rules shared by the entry forms and the bulk importer.
+# Each function returns an error message, or None when the values are valid.
+
+
+def medicine_error(name, category, buy_price, sell_price, stock):
+    if not name.strip():
+        return "Medicine Name cannot be empty."
+    if not category.strip():
+        return "Category cannot be empty."
+    # float() accepts "nan" and "inf", and NaN passes every comparison below
+    if not (math.isfinite(buy_price) and math.isfinite(sell_price)):
+        return "Prices must be finite numbers."
+    if buy_price <= 0:
+        return "Buy Price must be greater than 0."
+    if sell_price <= 0:
+        return "Sell Price must be greater than 0."
+    if stock < 0:
+        return "Stock cannot be negative."
+    return None
+
+
+def customer_error(name, contact, address):
+    if not name.strip():
+        return "Customer Name cannot be empty."
+    if not contact.strip() or not contact.isdigit() or len(contact) < 10:
+        return "Contact must be a valid phone number (at least 10 digits)."
+    if not address.strip():
+        return "Address cannot be empty."
+    return None